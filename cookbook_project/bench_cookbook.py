@@ -0,0 +1,254 @@
+import argparse
+import itertools
+import os
+import random
+import re
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from cookbook_lib import (
+    EXTRACTION_PROFILES,
+    IngredientIndex,
+    MappedIndex,
+    PageTextCache,
+    Recipe,
+    Span,
+    SpanTable,
+    TitleHeuristics,
+    load_pdf,
+    np,
+    save_index,
+    score_titles,
+    spans_from_dict,
+)
+
+
+def bench_extraction(pdf_path, max_pages=None, repeat=3):
+    # Per-page cost of building a TextPage and reading its spans for each
+    # extraction profile; best of `repeat` runs
+    doc = load_pdf(pdf_path)
+    pages = range(len(doc) if max_pages is None else min(max_pages, len(doc)))
+    results = {}
+    for profile, flags in EXTRACTION_PROFILES.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for pno in pages:
+                page = doc[pno]
+                textpage = page.get_textpage(flags=flags)
+                spans_from_dict(page.get_text("dict", textpage=textpage))
+                page.get_text("text", textpage=textpage)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[profile] = best / max(len(pages), 1)
+    doc.close()
+    return results
+
+
+def _legacy_title(spans):
+    # get_most_likely_title as it was before TitleHeuristics, for comparison
+    title_candidates = []
+    for span in spans:
+        text = span.text.strip()
+        size = span.size
+        if (
+            text
+            and len(text) < 50
+            and not any(char.isdigit() for char in text)
+            and not re.search(
+                r"\b(grams|ml|cup|tablespoon|teaspoon|oz)\b", text.lower()
+            )
+            and not re.match(
+                r"(?i)^(ingredients|method|directions|the cookery)$",
+                text.lower(),
+            )
+            and not text.endswith(".")
+        ):
+            title_candidates.append((text, size))
+    return (
+        sorted(title_candidates, key=lambda x: -x[1])[0][0]
+        if title_candidates
+        else None
+    )
+
+
+def synthetic_pages(n_pages, spans_per_page=60, seed=0):
+    # Cookbook-like pages: one large title, a few section headings and
+    # body/ingredient lines in a small size
+    rng = random.Random(seed)
+    words = ["chicken", "lemon", "garlic", "onion", "rice", "ginger", "basil"]
+    pages = []
+    for pno in range(n_pages):
+        no_bbox = (0, 0, 0, 0)
+        spans = [Span(f"Recipe {chr(65 + pno % 26)} Curry", 24.0, "Bold", 16, no_bbox)]
+        spans.append(Span("Ingredients", 14.0, "Bold", 16, no_bbox))
+        for _ in range(spans_per_page - 3):
+            line = " ".join(rng.choice(words) for _ in range(rng.randint(2, 8)))
+            if rng.random() < 0.4:
+                line = f"{rng.randint(1, 500)} grams {line}"
+            elif rng.random() < 0.5:
+                line = line.capitalize() + "."
+            spans.append(Span(line, 10.0, "Regular", 0, no_bbox))
+        spans.append(Span("Method", 14.0, "Bold", 16, no_bbox))
+        pages.append(spans)
+    return pages
+
+
+def bench_titles(pages, heuristics=None, repeat=5):
+    # Spans per second for the legacy per-span loop, for TitleHeuristics and
+    # (with numpy) for score_titles on a prebuilt SpanTable. Font tiers are
+    # off so that all three apply the same rules.
+    heuristics = heuristics or TitleHeuristics(heading_size_ratio=None)
+    n_spans = sum(len(spans) for spans in pages)
+    runs = [
+        ("legacy", lambda: [_legacy_title(spans) for spans in pages]),
+        ("heuristics", lambda: [heuristics.pick(spans) for spans in pages]),
+    ]
+    if np is not None:
+        table = SpanTable.from_pages(pages)
+        runs.append(("vectorized", lambda: score_titles(table, heuristics)))
+
+    results = {}
+    for name, run in runs:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = n_spans / best
+    return results
+
+
+# The head of the synthetic vocabulary, most frequent first
+COMMON_INGREDIENTS = [
+    "salt", "garlic", "onion", "oil", "chicken", "sugar", "lemon", "rice",
+    "ginger", "lime", "chilli", "coconut", "basil", "pork", "beef", "nuts",
+]  # fmt: skip
+
+# name, include, exclude, any_of
+QUERIES = [
+    ("chicken AND lemon NOT nuts", ["chicken", "lemon"], ["nuts"], []),
+    ("garlic AND onion AND salt", ["garlic", "onion", "salt"], [], []),
+    ("ingredientx AND garlic", ["ingredientx", "garlic"], [], []),
+    ("rice AND (basil OR lime)", ["rice"], [], ["basil", "lime"]),
+]
+
+
+METHOD_WORDS = (
+    "add stir heat until minutes serve mix pan bowl over cook bring boil simmer "
+    "season taste chop slice fry bake oven golden tender cover remove set aside"
+).split()
+
+
+def synthetic_recipes(n_recipes, vocabulary=5000, seed=0):
+    # Recipes of 6-15 ingredients drawn from a Zipf-like vocabulary
+    # (COMMON_INGREDIENTS first, then made-up words) plus some method prose,
+    # so posting lists range from most recipes down to a handful
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = COMMON_INGREDIENTS + ["ingredientx"]
+    while len(words) < vocabulary:
+        words.append("".join(rng.choices(letters, k=rng.randint(4, 9))))
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    recipes = []
+    for i in range(n_recipes):
+        ingredients = rng.choices(words, cum_weights=weights, k=rng.randint(6, 15))
+        method = rng.choices(METHOD_WORDS, k=40)
+        text = " ".join(ingredients) + "\n" + " ".join(method)
+        recipes.append(Recipe(i, f"Recipe {i}", None, f"book{i % 20}.pdf", 0, 1, text))
+    return recipes
+
+
+def bench_queries(index, queries=QUERIES, repeat=200):
+    # Best latency in seconds and the hit count of each query
+    results = {}
+    for name, include, exclude, any_of in queries:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ids = index.find_recipes(include, exclude, any_of)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = (best, len(ids))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench_cookbook")
+    benches = parser.add_subparsers(dest="bench", required=True)
+
+    extraction = benches.add_parser(
+        "extraction", help="per-page cost of each extraction profile"
+    )
+    extraction.add_argument("pdf")
+    extraction.add_argument("--pages", type=int, default=None)
+    extraction.add_argument("--repeat", type=int, default=3)
+
+    titles = benches.add_parser("titles", help="title heuristics in spans/second")
+    titles.add_argument(
+        "pdf", nargs="?", help="use this PDF's spans (default: synthetic pages)"
+    )
+    titles.add_argument("--pages", type=int, default=2000)
+    titles.add_argument("--repeat", type=int, default=5)
+
+    query = benches.add_parser(
+        "query", help="find_recipes latency at different corpus sizes"
+    )
+    query.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    query.add_argument("--repeat", type=int, default=200)
+
+    args = parser.parse_args(argv)
+
+    if args.bench == "extraction":
+        print(f"PyMuPDF {fitz.VersionBind}, {args.pdf}")
+        results = bench_extraction(args.pdf, args.pages, args.repeat)
+        baseline = results["images"]
+        for profile, per_page in results.items():
+            print(
+                f"{profile:>8}: {per_page * 1000:8.3f} ms/page "
+                f"({baseline / per_page:5.2f}x vs images)"
+            )
+
+    elif args.bench == "titles":
+        if args.pdf:
+            doc = load_pdf(args.pdf)
+            cache = PageTextCache(doc)
+            pages = [cache.page_spans(p) for p in range(min(args.pages, len(doc)))]
+            doc.close()
+        else:
+            pages = synthetic_pages(args.pages)
+        results = bench_titles(pages, repeat=args.repeat)
+        n_spans = sum(len(spans) for spans in pages)
+        print(f"{len(pages)} pages, {n_spans} spans")
+        for name, rate in results.items():
+            print(
+                f"{name:>10}: {rate:12,.0f} spans/s "
+                f"({rate / results['legacy']:5.2f}x vs legacy)"
+            )
+
+    elif args.bench == "query":
+        for size in args.sizes:
+            index = IngredientIndex.from_recipes(synthetic_recipes(size))
+            footprint = index.memory_footprint()["total"]
+            print(f"{size} recipes, {len(index)} words, {footprint / 1e6:.1f} MB")
+            for name, (best, hits) in bench_queries(index, repeat=args.repeat).items():
+                print(f"{name:>28}: {best * 1e6:9.1f} µs ({hits} recipes)")
+            # The same queries against the binary index file, opened with mmap
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "Index.bin")
+                save_index(index, path, format="binary")
+                start = time.perf_counter()
+                with MappedIndex(path) as mapped:
+                    opened = time.perf_counter() - start
+                    size = os.path.getsize(path) / 1e6
+                    print(f"  mapped: {size:.1f} MB, opened in {opened * 1e6:.0f} µs")
+                    results = bench_queries(mapped, repeat=args.repeat)
+                for name, (best, hits) in results.items():
+                    print(f"{name:>28}: {best * 1e6:9.1f} µs ({hits} recipes)")
+
+
+if __name__ == "__main__":
+    main()
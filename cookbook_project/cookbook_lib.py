@@ -1,8 +1,48 @@
 import os
 import re
+import sys
+import argparse
+import filecmp
+import itertools
 import fitz  # PyMuPDF
 import json
-from collections import defaultdict
+import mmap
+import struct
+import zlib
+import sqlite3
+import statistics
+import hashlib
+import queue
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict, namedtuple
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # optional: only the vectorized title scorer needs it
+    np = None
+
+
+# One text span from get_text("dict"), reduced to the fields the heuristics use
+Span = namedtuple("Span", ["text", "size", "font", "flags", "bbox"])
+
+# TextPage flags per extraction profile. One TextPage serves both the span
+# list and the plain text of a page, so a profile covers both. They are taken
+# from PyMuPDF's own defaults, so that they follow it across versions.
+#   text   - text spans only; same page text as get_text("text") (default)
+#   plain  - also drops ligature/whitespace preservation (fastest, but the
+#            page text differs: ligatures expanded, tabs become spaces)
+#   images - what get_text("dict") does by default: image blocks are decoded
+#            and embedded, then ignored by the title heuristics
+EXTRACTION_PROFILES = {
+    "text": fitz.TEXTFLAGS_TEXT,
+    "plain": fitz.TEXTFLAGS_TEXT
+    & ~(fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE),
+    "images": fitz.TEXTFLAGS_DICT,
+}
 
 
 def sanitize_title(title):
@@ -12,161 +52,1943 @@ def sanitize_title(title):
     return title
 
 
+def normalize_title(title):
+    return re.sub(r"[\W_]+", "", title).lower()
+
+
+class SlugRegistry:
+    # The file name slug of every recipe, looked up by (source, title) and
+    # computed once. Slugs are unique, also on case-insensitive disks. When a
+    # sanitized title is already taken by another source, the slug is
+    # qualified with this source's name ("Lemon_Chicken__B"), so that adding a
+    # book never renames another book's pages; titles of one source that
+    # sanitize alike get "_2", "_3", ... in the order they are registered.
+    # Pass the (title, source) pairs to register them up front, and the
+    # to_record() of the last build as `previous` to keep the slugs it handed
+    # out (e.g. after an earlier-sorting book with the same title was added).
+    def __init__(self, entries=(), previous=()):
+        self._slugs = {}
+        self._taken = {}  # casefolded slug → source
+        entries = list(entries)
+        keys = {(source, title) for title, source in entries}
+        for title, source, slug in previous:
+            if (source, title) in keys and slug.casefold() not in self._taken:
+                self._claim(source, title, slug)
+        for title, source in entries:
+            self.slug(title, source)
+
+    def __len__(self):
+        return len(self._slugs)
+
+    def _claim(self, source, title, slug):
+        self._taken[slug.casefold()] = source
+        self._slugs[(source, title)] = slug
+
+    def slug(self, title, source=None):
+        slug = self._slugs.get((source, title))
+        if slug is None:
+            base = sanitize_title(title) or "recipe"
+            if self._taken.get(base.casefold(), source) != source:
+                base = f"{base}__{sanitize_title(source)}"
+            slug, n = base, 1
+            while slug.casefold() in self._taken:
+                n += 1
+                slug = f"{base}_{n}"
+            self._claim(source, title, slug)
+        return slug
+
+    def to_record(self):
+        return [[title, source, slug] for (source, title), slug in self._slugs.items()]
+
+
+# How detect_headings decides that two page titles are the same recipe
+DEDUP_KEYS = {"exact": None, "normalized": normalize_title}
+
+
 def load_pdf(path):
     return fitz.open(path)
 
 
-def get_most_likely_title(page):
-    blocks = page.get_text("dict")["blocks"]
-    title_candidates = []
+def write_if_changed(path, content):
+    # Leave files whose content is already current untouched (incl. mtime)
+    mode, encoding = ("b", None) if isinstance(content, bytes) else ("", "utf-8")
+    try:
+        with open(path, "r" + mode, encoding=encoding) as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "w" + mode, encoding=encoding) as f:
+        f.write(content)
+    return True
+
+
+def _replace_if_changed(tmp_path, path):
+    # Same as write_if_changed for content that was streamed to tmp_path
+    if os.path.exists(path) and filecmp.cmp(tmp_path, path, shallow=False):
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, path)
+    return True
+
+
+class OutputWriter:
+    # Writes generated files on background threads, so that a slow (e.g.
+    # network) output volume does not stall the CPU-bound work. write()
+    # queues a (path, str or bytes) job and returns at once; beyond
+    # `max_pending` queued jobs or `max_bytes` of queued content it blocks,
+    # so the queue bounds memory however large the files are. Each file is
+    # written in one go to a temp file next to it and renamed into place, so
+    # readers never see a partial file, and files whose content is already
+    # current are left untouched, as with write_if_changed. Writes to the
+    # same path run on the same thread, in order. flush() waits for every
+    # queued write and re-raises the first error.
+    def __init__(self, threads=8, max_pending=256, max_bytes=64 * 2**20):
+        self._shards = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+            for _ in range(threads)
+        ]
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._errors = []
+        self._max_bytes = max_bytes
+        self._pending_bytes = 0
+        self._drained = threading.Condition()
+
+    def write(self, path, content):
+        size = len(content)
+        with self._drained:
+            # One file larger than the budget still goes, on its own
+            while self._pending_bytes and self._pending_bytes + size > self._max_bytes:
+                self._drained.wait()
+            self._pending_bytes += size
+        self._slots.acquire()
+        shard = self._shards[hash(path) % len(self._shards)]
+        future = shard.submit(self._write, path, content)
+        future.add_done_callback(lambda future: self._done(future, size))
+
+    def _done(self, future, size):
+        self._slots.release()
+        with self._drained:
+            self._pending_bytes -= size
+            self._drained.notify_all()
+        if future.exception() is not None:
+            with self._lock:
+                self._errors.append(future.exception())
+
+    @staticmethod
+    def _write(path, content):
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        try:
+            if os.path.getsize(path) == len(data):
+                with open(path, "rb") as f:
+                    if f.read() == data:
+                        return False
+        except FileNotFoundError:
+            pass
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return True
+
+    def flush(self):
+        # Each shard runs its jobs in order, so once a no-op has run on
+        # every shard, everything queued before it is on disk
+        for shard in self._shards:
+            shard.submit(int).result()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for shard in self._shards:
+                shard.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
-    for block in blocks:
+
+def _write_output(path, content, writer=None):
+    if writer is None:
+        write_if_changed(path, content)
+    else:
+        writer.write(path, content)
+
+
+def spans_from_dict(page_dict):
+    spans = []
+    for block in page_dict["blocks"]:
         if "lines" in block:
             for line in block["lines"]:
                 for span in line["spans"]:
-                    text = span["text"].strip()
-                    size = span["size"]
-                    if (
-                        text
-                        and len(text) < 50
-                        and not any(char.isdigit() for char in text)
-                        and not re.search(
-                            r"\b(grams|ml|cup|tablespoon|teaspoon|oz)\b", text.lower()
-                        )
-                        and not re.match(
-                            r"(?i)^(ingredients|method|directions|the cookery)$",
-                            text.lower(),
+                    spans.append(
+                        Span(
+                            span["text"],
+                            span["size"],
+                            span["font"],
+                            span["flags"],
+                            tuple(span["bbox"]),
                         )
-                        and not text.endswith(".")
-                    ):
-                        title_candidates.append((text, size))
+                    )
+    return spans
 
-    return (
-        sorted(title_candidates, key=lambda x: -x[1])[0][0]
-        if title_candidates
-        else None
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _encode_spans(spans):
+    return [[s.text, s.size, s.font, s.flags, *s.bbox] for s in spans]
+
+
+def _decode_spans(rows):
+    return [Span(r[0], r[1], r[2], r[3], tuple(r[4:8])) for r in rows]
+
+
+class ExtractionStore:
+    # Persistent page extraction cache: one SQLite file holding zlib-compressed
+    # span lists and page texts keyed by (PDF SHA-256, page index, mode).
+    # Writes are buffered and committed in one batch by flush()/close(), so
+    # build workers in separate processes only hold the write lock briefly.
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "sha256 TEXT, page INTEGER, mode TEXT, data BLOB, "
+            "PRIMARY KEY (sha256, page, mode))"
+        )
+        self.conn.commit()
+        self._pending = []
+
+    def load(self, sha256):
+        rows = self.conn.execute(
+            "SELECT page, mode, data FROM pages WHERE sha256 = ?", (sha256,)
+        )
+        return {(page, mode): data for page, mode, data in rows}
+
+    def put(self, sha256, page, mode, value):
+        data = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        self._pending.append((sha256, page, mode, data))
+
+    @staticmethod
+    def decode(data):
+        return json.loads(zlib.decompress(data).decode("utf-8"))
+
+    def flush(self):
+        if self._pending:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)", self._pending
+                )
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RecipeCatalog:
+    # The built library as one SQLite database for other tools: every recipe
+    # (source PDF, title, slug of its master-site page, page range
+    # [start_page, end_page) 0-based as in the records, and its sections), the
+    # ingredient index, and an FTS5 table over titles and sections, e.g.
+    #   SELECT title, source FROM recipe_search
+    #   WHERE recipe_search MATCH 'ingredients: (chicken AND lemon) NOT nuts'
+    # Rows are kept per source PDF: replace_source() swaps one PDF's rows in a
+    # single transaction, so a rebuild only rewrites the PDFs that changed.
+    # The master-site slugs depend on the whole library, so a build writes
+    # them last with set_slugs(); rows replace_source() writes have none
+    # until then.
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sources (
+        source TEXT PRIMARY KEY, stage_key TEXT
+    );
+    CREATE TABLE IF NOT EXISTS recipes (
+        id INTEGER PRIMARY KEY, source TEXT NOT NULL, title TEXT NOT NULL,
+        slug TEXT, start_page INTEGER, end_page INTEGER,
+        intro TEXT, ingredients TEXT, method TEXT
+    );
+    CREATE INDEX IF NOT EXISTS recipes_source ON recipes (source);
+    CREATE TABLE IF NOT EXISTS ingredients (
+        word TEXT NOT NULL, recipe INTEGER NOT NULL, PRIMARY KEY (word, recipe)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS ingredients_recipe ON ingredients (recipe);
+    CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search USING fts5(
+        title, intro, ingredients, method, content='recipes', content_rowid='id'
+    );
+    CREATE TRIGGER IF NOT EXISTS recipes_insert AFTER INSERT ON recipes BEGIN
+        INSERT INTO recipe_search (rowid, title, intro, ingredients, method)
+        VALUES (new.id, new.title, new.intro, new.ingredients, new.method);
+    END;
+    CREATE TRIGGER IF NOT EXISTS recipes_delete AFTER DELETE ON recipes BEGIN
+        INSERT INTO recipe_search
+            (recipe_search, rowid, title, intro, ingredients, method)
+        VALUES ('delete', old.id, old.title, old.intro, old.ingredients, old.method);
+    END;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def stage_keys(self):
+        # {source: stage key it was last written with}
+        return dict(self.conn.execute("SELECT source, stage_key FROM sources"))
+
+    def replace_source(self, source, recipes, index, stage_key=None, slugs=None):
+        # `index` is the IngredientIndex of `recipes`, in the same order;
+        # `slugs` the master site's SlugRegistry, if it is known yet
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._delete(source)
+            first = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) + 1 FROM recipes"
+            ).fetchone()[0]
+            rows = []
+            for i, recipe in enumerate(recipes):
+                sections = {section: text.strip() for section, text in recipe.sections}
+                rows.append(
+                    (
+                        first + i,
+                        source,
+                        recipe.title,
+                        None if slugs is None else slugs.slug(recipe.title, source),
+                        recipe.start,
+                        recipe.end,
+                        sections.get(None),
+                        sections.get("ingredients"),
+                        sections.get("method"),
+                    )
+                )
+            conn.executemany(
+                "INSERT INTO recipes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            conn.executemany(
+                "INSERT INTO ingredients VALUES (?, ?)",
+                ((word, first + rid) for word in index for rid in index.postings(word)),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?)", (source, stage_key)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def set_slugs(self, slugs):
+        # Store the master-site slug of every recipe in the SlugRegistry;
+        # rows that already have theirs are not touched
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "UPDATE recipes SET slug = ? "
+                "WHERE source = ? AND title = ? AND slug IS NOT ?",
+                (
+                    (slug, source, title, slug)
+                    for title, source, slug in slugs.to_record()
+                ),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def remove_source(self, source):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._delete(source)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _delete(self, source):
+        conn = self.conn
+        conn.execute(
+            "DELETE FROM ingredients WHERE recipe IN "
+            "(SELECT id FROM recipes WHERE source = ?)",
+            (source,),
+        )
+        conn.execute("DELETE FROM recipes WHERE source = ?", (source,))
+        conn.execute("DELETE FROM sources WHERE source = ?", (source,))
+
+    def search(self, query, limit=20):
+        # [(title, source, start_page, end_page)] for an FTS5 query, best first
+        return self.conn.execute(
+            "SELECT r.title, r.source, r.start_page, r.end_page "
+            "FROM recipe_search JOIN recipes r ON r.id = recipe_search.rowid "
+            "WHERE recipe_search MATCH ? ORDER BY rank LIMIT ?",
+            (query, limit),
+        ).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PageTextCache:
+    # Extracts each page of a document exactly once: one TextPage per page
+    # yields both the spans (for title detection) and the plain text (for the
+    # exporters). Pass the same cache to every stage of a build. With an
+    # ExtractionStore, pages of an unchanged PDF are read back from disk
+    # without any MuPDF parsing.
+    def __init__(self, doc, store=None, sha256=None, profile="text"):
+        self.doc = doc
+        self.store = store
+        self.profile = profile
+        self.flags = EXTRACTION_PROFILES[profile]
+        self.page_count = len(doc)
+        self._spans = {}
+        self._texts = {}
+        self._stored = {}
+        if store is not None:
+            self.sha256 = sha256 or file_sha256(doc.name)
+            self._stored = store.load(self.sha256)
+        self._spans_mode = f"spans:{self.flags}"
+        self._text_mode = f"text:{self.flags}"
+
+    def __len__(self):
+        return self.page_count
+
+    def _load_stored(self, pno):
+        spans = self._stored.pop((pno, self._spans_mode), None)
+        text = self._stored.pop((pno, self._text_mode), None)
+        if spans is None or text is None:
+            return False
+        self._spans[pno] = _decode_spans(ExtractionStore.decode(spans))
+        self._texts[pno] = ExtractionStore.decode(text)
+        return True
+
+    def _extract(self, pno):
+        if self._stored and self._load_stored(pno):
+            return
+        page = self.doc[pno]
+        textpage = page.get_textpage(flags=self.flags)
+        self.prime(
+            pno,
+            spans_from_dict(page.get_text("dict", textpage=textpage)),
+            page.get_text("text", textpage=textpage),
+        )
+
+    def prime(self, pno, spans, text):
+        # Accept a page extracted elsewhere (e.g. by a worker process)
+        self._spans[pno] = spans
+        self._texts[pno] = text
+        if self.store is not None:
+            self.store.put(self.sha256, pno, self._spans_mode, _encode_spans(spans))
+            self.store.put(self.sha256, pno, self._text_mode, text)
+
+    def is_complete(self):
+        return all(
+            pno in self._spans or (pno, self._spans_mode) in self._stored
+            for pno in range(len(self))
+        )
+
+    def page_spans(self, pno):
+        if pno not in self._spans:
+            self._extract(pno)
+        return self._spans[pno]
+
+    def page_text(self, pno):
+        if pno not in self._texts:
+            self._extract(pno)
+        return self._texts[pno]
+
+    def range_text(self, start, end):
+        return "".join(self.page_text(p) for p in range(start, end))
+
+
+def _page_cache(doc, cache=None):
+    if cache is not None:
+        return cache
+    if isinstance(doc, (PageTextCache, SpanTable)):
+        return doc
+    return PageTextCache(doc)
+
+
+# PyMuPDF span flag bit for bold text
+SPAN_BOLD = 16
+
+
+class FontTiers:
+    # Document-wide font statistics. The histogram counts characters per
+    # (size, font, bold) style. The size holding the most text is the body
+    # size, and every (size, bold) style at least `min_ratio` times larger is
+    # a heading tier (0 = largest). tier() is then a single dict lookup.
+    def __init__(self, pages, min_ratio=1.2, max_tiers=None):
+        self.histogram = Counter()
+        for spans in pages:
+            for span in spans:
+                chars = len(span.text.strip())
+                if chars:
+                    bold = bool(span.flags & SPAN_BOLD)
+                    self.histogram[(round(span.size, 1), span.font, bold)] += chars
+
+        by_size = Counter()
+        for (size, _, _), chars in self.histogram.items():
+            by_size[size] += chars
+        self.body_size = by_size.most_common(1)[0][0] if by_size else None
+
+        styles = sorted(
+            {
+                (size, bold)
+                for size, _, bold in self.histogram
+                if size >= self.body_size * min_ratio
+            },
+            reverse=True,
+        )
+        if max_tiers is not None:
+            styles = styles[:max_tiers]
+        self._tiers = {style: tier for tier, style in enumerate(styles)}
+
+    def __len__(self):
+        return len(self._tiers)
+
+    def tier(self, span):
+        return self._tiers.get((round(span.size, 1), bool(span.flags & SPAN_BOLD)))
+
+
+class TitleHeuristics:
+    # The rules that decide whether a span can be a recipe title, compiled
+    # once. A page's title is its largest span that passes every rule (the
+    # first one on ties). Spans no larger than the best candidate so far are
+    # skipped before any text check, and the checks run cheapest first.
+    # With heading_size_ratio set, only spans in a heading tier of the
+    # document's FontTiers qualify, so body-size text never becomes a title.
+    UNIT_WORDS = ("grams", "ml", "cup", "tablespoon", "teaspoon", "oz")
+    EXCLUDED_TITLES = ("ingredients", "method", "directions", "the cookery")
+
+    def __init__(
+        self,
+        max_length=50,
+        unit_words=UNIT_WORDS,
+        excluded_titles=EXCLUDED_TITLES,
+        reject_digits=True,
+        reject_trailing_period=True,
+        use_outline=True,
+        min_outline_entries=3,
+        max_outline_pages=4,
+        dedup="exact",
+        heading_size_ratio=1.2,
+        max_heading_tiers=None,
+    ):
+        self.max_length = max_length
+        self.unit_words = tuple(unit_words)
+        self.excluded_titles = tuple(excluded_titles)
+        self.reject_digits = reject_digits
+        self.reject_trailing_period = reject_trailing_period
+        self.use_outline = use_outline
+        self.min_outline_entries = min_outline_entries
+        self.max_outline_pages = max_outline_pages
+        self.dedup = dedup
+        self.dedup_key = DEDUP_KEYS[dedup]
+        self.heading_size_ratio = heading_size_ratio
+        self.max_heading_tiers = max_heading_tiers
+
+        self._excluded = frozenset(t.lower() for t in self.excluded_titles)
+        self._units = (
+            re.compile(r"\b(" + "|".join(map(re.escape, self.unit_words)) + r")\b")
+            if self.unit_words
+            else None
+        )
+        self._ascii_digit = re.compile(r"[0-9]")
+
+    def config(self):
+        return {
+            "max_length": self.max_length,
+            "unit_words": list(self.unit_words),
+            "excluded_titles": list(self.excluded_titles),
+            "reject_digits": self.reject_digits,
+            "reject_trailing_period": self.reject_trailing_period,
+            "use_outline": self.use_outline,
+            "min_outline_entries": self.min_outline_entries,
+            "max_outline_pages": self.max_outline_pages,
+            "dedup": self.dedup,
+            "heading_size_ratio": self.heading_size_ratio,
+            "max_heading_tiers": self.max_heading_tiers,
+        }
+
+    def _has_digit(self, text):
+        # Same result as any(c.isdigit() for c in text), without the
+        # per-character Python loop for the (common) ASCII case
+        if text.isascii():
+            return self._ascii_digit.search(text) is not None
+        return any(char.isdigit() for char in text)
+
+    def is_excluded(self, text):
+        return text.lower() in self._excluded
+
+    def accepts(self, text):
+        if not text or len(text) >= self.max_length:
+            return False
+        if self.reject_trailing_period and text.endswith("."):
+            return False
+        lowered = text.lower()
+        if lowered in self._excluded:
+            return False
+        if self.reject_digits and self._has_digit(text):
+            return False
+        if self._units is not None and self._units.search(lowered):
+            return False
+        return True
+
+    def font_tiers(self, pages):
+        # None when tiers are disabled or the document has no text larger
+        # than its body size (then every span stays eligible)
+        if self.heading_size_ratio is None:
+            return None
+        tiers = FontTiers(pages, self.heading_size_ratio, self.max_heading_tiers)
+        return tiers if len(tiers) else None
+
+    def pick(self, spans, tiers=None):
+        best_title, best_size = None, None
+        for span in spans:
+            size = span.size
+            if best_size is not None and size <= best_size:
+                continue
+            if tiers is not None and tiers.tier(span) is None:
+                continue
+            text = span.text.strip()
+            if self.accepts(text):
+                best_title, best_size = text, size
+        return best_title
+
+
+DEFAULT_HEURISTICS = TitleHeuristics()
+
+
+def title_from_spans(spans, heuristics=None, tiers=None):
+    return (heuristics or DEFAULT_HEURISTICS).pick(spans, tiers)
+
+
+def get_most_likely_title(page, profile="text", heuristics=None):
+    flags = EXTRACTION_PROFILES[profile]
+    spans = spans_from_dict(page.get_text("dict", flags=flags))
+    return title_from_spans(spans, heuristics)
+
+
+class SpanTable:
+    # Columnar copy of a document's spans, one row per span in page order:
+    # stripped text, size, font, flags, bbox and page number. It stands in for
+    # a PageTextCache in detect_headings (spans only, no page text) and is
+    # what score_titles works on. With the document's outline as `toc`
+    # ([level, title, page] like get_toc), detect_headings can also take the
+    # outline path without the PDF. Requires numpy.
+    def __init__(
+        self, texts, sizes, fonts, font_ids, flags, bboxes, pages, page_count, toc=None
+    ):
+        if np is None:
+            raise ImportError("SpanTable requires numpy")
+        self.doc = None
+        self.toc = toc
+        self.texts = list(texts)
+        self.sizes = np.asarray(sizes, dtype=np.float64)
+        self.fonts = list(fonts)
+        self.font_ids = np.asarray(font_ids, dtype=np.int32)
+        self.flags = np.asarray(flags, dtype=np.int32)
+        self.bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        self.pages = np.asarray(pages, dtype=np.int32)
+        self.page_count = page_count
+        self._page_starts = np.searchsorted(self.pages, np.arange(page_count + 1))
+        self._rounded_sizes = None
+        self._lengths = None
+
+    @classmethod
+    def from_pages(cls, pages, toc=None):
+        texts, sizes, font_ids, flags, bboxes, page_numbers = [], [], [], [], [], []
+        fonts = {}
+        page_count = 0
+        for pno, spans in enumerate(pages):
+            page_count = pno + 1
+            for span in spans:
+                texts.append(span.text.strip())
+                sizes.append(span.size)
+                font_ids.append(fonts.setdefault(span.font, len(fonts)))
+                flags.append(span.flags)
+                bboxes.append(span.bbox)
+                page_numbers.append(pno)
+        return cls(
+            texts, sizes, fonts, font_ids, flags, bboxes, page_numbers, page_count, toc
+        )
+
+    @classmethod
+    def from_cache(cls, cache, toc=None):
+        return cls.from_pages((cache.page_spans(i) for i in range(len(cache))), toc)
+
+    def __len__(self):
+        return self.page_count
+
+    def get_toc(self, simple=True):
+        return self.toc or []
+
+    def is_complete(self):
+        return True
+
+    def page_spans(self, pno):
+        start, end = self._page_starts[pno], self._page_starts[pno + 1]
+        return [
+            Span(
+                self.texts[i],
+                float(self.sizes[i]),
+                self.fonts[self.font_ids[i]],
+                int(self.flags[i]),
+                tuple(float(v) for v in self.bboxes[i]),
+            )
+            for i in range(start, end)
+        ]
+
+    @property
+    def lengths(self):
+        if self._lengths is None:
+            self._lengths = np.fromiter(
+                map(len, self.texts), dtype=np.int64, count=len(self.texts)
+            )
+        return self._lengths
+
+    @property
+    def rounded_sizes(self):
+        # Python's round(), as used by FontTiers (np.round differs on ties)
+        if self._rounded_sizes is None:
+            self._rounded_sizes = np.array(
+                [round(size, 1) for size in self.sizes.tolist()], dtype=np.float64
+            )
+        return self._rounded_sizes
+
+
+def _pack_strings(strings):
+    # String table: one utf-8 buffer plus byte offsets
+    encoded = [s.encode("utf-8", "surrogatepass") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(data, offsets, start=0, end=None):
+    # Strings start..end of a table, decoding only their part of the buffer
+    end = len(offsets) - 1 if end is None else end
+    bounds = offsets[start : end + 1]
+    raw = data[bounds[0] : bounds[-1]].tobytes()
+    text = raw.decode("utf-8", "surrogatepass")
+    bounds = (bounds - bounds[0]).tolist()
+    if len(text) == len(raw):  # all ASCII: byte and character offsets agree
+        return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+    return [
+        raw[a:b].decode("utf-8", "surrogatepass") for a, b in zip(bounds, bounds[1:])
+    ]
+
+
+class SpanLibrary:
+    # Columnar span store for a whole library, saved as a single .npz file:
+    # the spans of every source PDF (text, size, font, flags, bbox, page) as
+    # numeric columns plus utf-8 string tables, and each PDF's outline.
+    # table(source) rebuilds that PDF's SpanTable without PyMuPDF, so
+    # detect_headings can re-run a heuristics change over the whole library
+    # from this one file. Texts are stored stripped, as in SpanTable.
+    FORMAT = 1
+
+    def __init__(self, columns):
+        if np is None:
+            raise ImportError("SpanLibrary requires numpy")
+        self.columns = columns
+        c = columns
+        self.sources = _unpack_strings(c["source_data"], c["source_offsets"])
+        self.sha256 = _unpack_strings(c["sha256_data"], c["sha256_offsets"])
+        self.profile = str(columns["profile"])
+        self._index = {source: i for i, source in enumerate(self.sources)}
+        self._fonts = None
+
+    @classmethod
+    def from_tables(cls, tables, profile="text"):
+        # tables: [(source, sha256, SpanTable)]
+        tables = list(tables)
+        fonts = {}
+        texts, font_ids, toc_titles, toc_levels, toc_pages = [], [], [], [], []
+        span_rows, toc_rows = [0], [0]
+        for _, _, table in tables:
+            font_map = np.array(
+                [fonts.setdefault(font, len(fonts)) for font in table.fonts],
+                dtype=np.int32,
+            )
+            font_ids.append(font_map[table.font_ids])
+            texts.extend(table.texts)
+            span_rows.append(span_rows[-1] + len(table.texts))
+            for level, title, page in table.get_toc():
+                toc_levels.append(level)
+                toc_titles.append(title)
+                toc_pages.append(page)
+            toc_rows.append(len(toc_titles))
+
+        def concat(arrays, dtype, shape=(0,)):
+            return np.concatenate(arrays) if arrays else np.zeros(shape, dtype=dtype)
+
+        columns = {
+            "format": np.array(cls.FORMAT),
+            "profile": np.array(profile),
+            "span_rows": np.array(span_rows, dtype=np.int64),
+            "page_counts": np.array(
+                [table.page_count for _, _, table in tables], dtype=np.int32
+            ),
+            "sizes": concat([t.sizes for _, _, t in tables], np.float64),
+            "font_ids": concat(font_ids, np.int32),
+            "flags": concat([t.flags for _, _, t in tables], np.int32),
+            "bboxes": concat([t.bboxes for _, _, t in tables], np.float32, (0, 4)),
+            "pages": concat([t.pages for _, _, t in tables], np.int32),
+            "toc_rows": np.array(toc_rows, dtype=np.int64),
+            "toc_levels": np.array(toc_levels, dtype=np.int32),
+            "toc_pages": np.array(toc_pages, dtype=np.int32),
+        }
+        for name, strings in (
+            ("source", [source for source, _, _ in tables]),
+            ("sha256", [sha256 for _, sha256, _ in tables]),
+            ("text", texts),
+            ("font", fonts),
+            ("toc_title", toc_titles),
+        ):
+            columns[f"{name}_data"], columns[f"{name}_offsets"] = _pack_strings(strings)
+        return cls(columns)
+
+    @classmethod
+    def from_pdfs(cls, pdf_paths, store=None, profile="text", previous=None):
+        # Spans of each PDF, read through an ExtractionStore when given. PDFs
+        # whose hash is unchanged in `previous` (same profile) are copied from
+        # it without opening them.
+        tables = []
+        for path in pdf_paths:
+            source = os.path.basename(path)
+            sha256 = file_sha256(path)
+            if (
+                previous is not None
+                and previous.profile == profile
+                and previous.sha256_of(source) == sha256
+            ):
+                tables.append((source, sha256, previous.table(source)))
+                continue
+            doc = load_pdf(path)
+            try:
+                cache = PageTextCache(doc, store, sha256, profile)
+                toc = doc.get_toc(simple=True)
+                tables.append((source, sha256, SpanTable.from_cache(cache, toc)))
+            finally:
+                doc.close()
+            if store is not None:
+                store.flush()
+        return cls.from_tables(tables, profile)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            columns = dict(npz)
+        if int(columns["format"]) != cls.FORMAT:
+            raise ValueError(f"{path}: unsupported span store format")
+        return cls(columns)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **self.columns)
+        _replace_if_changed(tmp_path, path)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __contains__(self, source):
+        return source in self._index
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def sha256_of(self, source):
+        i = self._index.get(source)
+        return None if i is None else self.sha256[i]
+
+    @property
+    def fonts(self):
+        if self._fonts is None:
+            c = self.columns
+            self._fonts = _unpack_strings(c["font_data"], c["font_offsets"])
+        return self._fonts
+
+    def table(self, source):
+        c = self.columns
+        i = self._index[source]
+        start, end = c["span_rows"][i : i + 2].tolist()
+        toc_start, toc_end = c["toc_rows"][i : i + 2].tolist()
+        toc_titles = _unpack_strings(
+            c["toc_title_data"], c["toc_title_offsets"], toc_start, toc_end
+        )
+        toc = [
+            [level, title, page]
+            for level, title, page in zip(
+                c["toc_levels"][toc_start:toc_end].tolist(),
+                toc_titles,
+                c["toc_pages"][toc_start:toc_end].tolist(),
+            )
+        ]
+        return SpanTable(
+            _unpack_strings(c["text_data"], c["text_offsets"], start, end),
+            c["sizes"][start:end],
+            self.fonts,
+            c["font_ids"][start:end],
+            c["flags"][start:end],
+            c["bboxes"][start:end],
+            c["pages"][start:end],
+            int(c["page_counts"][i]),
+            toc,
+        )
+
+    def tables(self):
+        for source in self.sources:
+            yield source, self.table(source)
+
+
+def _rows_matching(pattern, joined, starts):
+    # Rows of a "\x00"-joined text column that contain a regex match
+    positions = [m.start() for m in pattern.finditer(joined)]
+    if not positions:
+        return np.zeros(0, dtype=np.int64)
+    return np.searchsorted(starts, positions, side="right") - 1
+
+
+def _rule_mask(texts, heuristics):
+    # TitleHeuristics.accepts() for a list of texts at once: the string rules
+    # run as C-level scans over one joined string and map back to rows
+    n = len(texts)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+    mask = (lengths > 0) & (lengths < heuristics.max_length)
+    if n == 0:
+        return mask
+
+    starts = np.zeros(n, dtype=np.int64)
+    starts[1:] = np.cumsum(lengths[:-1] + 1)
+    ends = starts + lengths
+    joined = "\x00".join(texts)
+    codes = np.frombuffer(
+        joined.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
     )
 
+    if heuristics.reject_trailing_period:
+        nonempty = lengths > 0
+        period = np.zeros(n, dtype=bool)
+        period[nonempty] = codes[ends[nonempty] - 1] == ord(".")
+        mask &= ~period
+
+    if heuristics.reject_digits:
+        digits = np.concatenate(([0], np.cumsum((codes >= 48) & (codes <= 57))))
+        has_digit = digits[ends] > digits[starts]
+        # Non-ASCII digits (superscripts etc.) only matter for non-ASCII rows
+        wide = np.concatenate(([0], np.cumsum(codes > 127)))
+        for row in np.flatnonzero((wide[ends] > wide[starts]) & ~has_digit).tolist():
+            has_digit[row] = any(char.isdigit() for char in texts[row])
+        mask &= ~has_digit
+
+    lowered = list(map(str.lower, texts))
+    lowered_lengths = np.fromiter(map(len, lowered), dtype=np.int64, count=n)
+    lowered_starts = np.zeros(n, dtype=np.int64)
+    lowered_starts[1:] = np.cumsum(lowered_lengths[:-1] + 1)
+    joined_lower = "\x00".join(lowered)
+
+    if heuristics._excluded:
+        excluded = np.fromiter(
+            map(heuristics._excluded.__contains__, lowered), dtype=bool, count=n
+        )
+        mask &= ~excluded
+    if heuristics._units is not None:
+        mask[_rows_matching(heuristics._units, joined_lower, lowered_starts)] = False
+    return mask
+
+
+def _tier_mask(table, heuristics):
+    # FontTiers.tier(span) is not None, for every row at once
+    if heuristics.heading_size_ratio is None:
+        return None
+    lengths = table.lengths
+    valid = lengths > 0
+    if not valid.any():
+        return None
+    rounded = table.rounded_sizes
+    bold = (table.flags & SPAN_BOLD) != 0
+
+    sizes, first_row, inverse = np.unique(
+        rounded[valid], return_index=True, return_inverse=True
+    )
+    chars = np.bincount(inverse, weights=lengths[valid])
+    # Body size: most characters; on ties the size seen first (like Counter)
+    top = np.flatnonzero(chars == chars.max())
+    body_size = sizes[top[np.argmin(first_row[top])]]
+
+    heading = rounded[valid] >= body_size * heuristics.heading_size_ratio
+    styles = sorted(
+        set(zip(rounded[valid][heading].tolist(), bold[valid][heading].tolist())),
+        reverse=True,
+    )
+    if heuristics.max_heading_tiers is not None:
+        styles = styles[: heuristics.max_heading_tiers]
+    if not styles:
+        return None
+    mask = np.zeros(len(rounded), dtype=bool)
+    for size, is_bold in styles:
+        mask |= (rounded == size) & (bold == is_bold)
+    return mask
+
+
+def score_titles(table, heuristics=None):
+    # Vectorized detect_headings scoring: the (title, page) candidate of
+    # every page in one batched pass. Same result as TitleHeuristics.pick
+    # with the document's FontTiers, page by page.
+    heuristics = heuristics or DEFAULT_HEURISTICS
+    rows = np.arange(len(table.texts))
+    tiers = _tier_mask(table, heuristics)
+    if tiers is not None:
+        rows = rows[tiers]
+
+    # Per page: largest size first, then the earliest row on ties
+    rows = rows[np.lexsort((rows, -table.sizes[rows], table.pages[rows]))]
+    pages = table.pages[rows]
+    rank = np.arange(len(rows)) - np.searchsorted(pages, pages)
+
+    # Like pick(), spare the text rules for spans that cannot win: check the
+    # four largest spans of each page first, the rest only on pages where
+    # none of those qualified
+    accepted = np.zeros(len(rows), dtype=bool)
+    head = np.flatnonzero(rank < 4)
+    accepted[head] = _rule_mask([table.texts[r] for r in rows[head].tolist()], heuristics)
+    tail = np.flatnonzero((rank >= 4) & ~np.isin(pages, pages[accepted]))
+    accepted[tail] = _rule_mask([table.texts[r] for r in rows[tail].tolist()], heuristics)
+
+    winners = np.flatnonzero(accepted)
+    first = np.ones(len(winners), dtype=bool)
+    first[1:] = pages[winners][1:] != pages[winners][:-1]
+    return [
+        (table.texts[row], int(table.pages[row])) for row in rows[winners[first]].tolist()
+    ]
+
+
+def dedup_headings(candidates, key=None):
+    # Keep the first page of every title (compared by key(title) if given).
+    # Returns the headings plus the suppressed repeats as
+    # (title, page, first_page) so that the dedup can be audited.
+    headings, suppressed, first_page = [], [], {}
+    for title, page in candidates:
+        k = key(title) if key else title
+        if k in first_page:
+            suppressed.append((title, page, first_page[k]))
+        else:
+            first_page[k] = page
+            headings.append((title, page))
+    return headings, suppressed
+
+
+def _scan_title_range(path, start, end, profile, heuristics):
+    # Worker: fitz documents cannot be shared, so each process opens its own
+    doc = fitz.open(path)
+    try:
+        cache = PageTextCache(doc, profile=profile)
+        pages = []
+        for pno in range(start, end):
+            spans = cache.page_spans(pno)
+            title = heuristics.pick(spans) if heuristics else None
+            pages.append((pno, title, spans, cache.page_text(pno)))
+        return pages
+    finally:
+        doc.close()
+
+
+def _scan_titles_parallel(path, cache, jobs, heuristics):
+    # With heuristics=None the workers only extract
+    n = len(cache)
+    step = -(-n // jobs)
+    candidates = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(
+                _scan_title_range,
+                path,
+                start,
+                min(start + step, n),
+                cache.profile,
+                heuristics,
+            )
+            for start in range(0, n, step)
+        ]
+        # Futures are consumed in submission order, i.e. in page order
+        for future in futures:
+            for pno, title, spans, text in future.result():
+                cache.prime(pno, spans, text)
+                if title:
+                    candidates.append((title, pno))
+    return candidates
+
 
-def detect_headings(doc):
+def outline_headings(doc, heuristics=None, suppressed=None):
+    # Recipe boundaries straight from the PDF bookmarks. Returns None unless
+    # some outline level looks like one entry per recipe: enough entries,
+    # pages in reading order, (nearly) one entry per start page and entries
+    # no longer than max_outline_pages on median, so that chapter bookmarks
+    # over several recipes are not taken for recipes. Of the levels that
+    # qualify, the one with the most entries wins.
+    heuristics = heuristics or DEFAULT_HEURISTICS
+    by_level = defaultdict(list)
+    for level, title, page in doc.get_toc(simple=True):
+        title = title.strip()
+        if title and 1 <= page <= len(doc):
+            by_level[level].append((title, page - 1))
+
+    best = None
+    for level, entries in sorted(by_level.items()):
+        entries = [
+            (title, page)
+            for title, page in entries
+            if not heuristics.is_excluded(title)
+        ]
+        pages = [page for _, page in entries]
+        lengths = [end - start for start, end in zip(pages, pages[1:] + [len(doc)])]
+        if (
+            len(entries) >= heuristics.min_outline_entries
+            and pages == sorted(pages)
+            and len(set(pages)) >= 0.8 * len(pages)
+            and (
+                heuristics.max_outline_pages is None
+                or statistics.median(lengths) <= heuristics.max_outline_pages
+            )
+            and (best is None or len(entries) >= len(best))
+        ):
+            best = entries
+    if not best:
+        return None
+
+    # Keep one recipe per start page so that every page range is non-empty
+    unique, duplicates = dedup_headings(best, heuristics.dedup_key)
     headings = []
-    for i, page in enumerate(doc):
-        title = get_most_likely_title(page)
-        if title and title not in [h[0] for h in headings]:
-            headings.append((title, i))
+    for title, page in unique:
+        if headings and page == headings[-1][1]:
+            duplicates.append((title, page, page))
+        else:
+            headings.append((title, page))
+    if suppressed is not None:
+        suppressed.extend(duplicates)
     return headings
 
 
-def normalize_title(title):
-    return re.sub(r"[\W_]+", "", title).lower()
+def detect_headings(
+    doc, cache=None, jobs=1, heuristics=None, suppressed=None, vectorized=False
+):
+    # Pass a list as `suppressed` to collect the (title, page, first_page)
+    # of every page title dropped as a repeat. vectorized=True scores all
+    # pages in one numpy pass (see score_titles); the result is the same.
+    cache = _page_cache(doc, cache)
+    heuristics = heuristics or DEFAULT_HEURISTICS
+    # A SpanTable carries the outline itself when it was stored without the PDF
+    outline_doc = cache.doc if cache.doc is not None else cache
+    if heuristics.use_outline and hasattr(outline_doc, "get_toc"):
+        duplicates = []
+        headings = outline_headings(outline_doc, heuristics, duplicates)
+        if headings:
+            if suppressed is not None:
+                suppressed.extend(duplicates)
+            return headings
 
+    # Font tiers need every page's spans, so with tiers enabled (or when
+    # scoring vectorized) the workers only extract and the titles are picked
+    # here from the primed cache
+    pick_in_workers = heuristics.heading_size_ratio is None and not vectorized
+    path = getattr(cache.doc, "name", "")
+    parallel = jobs > 1 and path and len(cache) > 1 and not cache.is_complete()
+    if parallel:
+        candidates = _scan_titles_parallel(
+            path, cache, jobs, heuristics if pick_in_workers else None
+        )
 
-def split_recipes(doc, headings, out_dir):
-    os.makedirs(out_dir, exist_ok=True)
-    for i, (title, start_page) in enumerate(headings):
-        end_page = headings[i + 1][1] if i + 1 < len(headings) else len(doc)
+    if vectorized:
+        table = cache if isinstance(cache, SpanTable) else SpanTable.from_cache(cache)
+        candidates = score_titles(table, heuristics)
+    elif not (parallel and pick_in_workers):
+        tiers = heuristics.font_tiers(cache.page_spans(i) for i in range(len(cache)))
+        candidates = []
+        for i in range(len(cache)):
+            title = heuristics.pick(cache.page_spans(i), tiers)
+            if title:
+                candidates.append((title, i))
+
+    headings, duplicates = dedup_headings(candidates, heuristics.dedup_key)
+    if suppressed is not None:
+        suppressed.extend(duplicates)
+    return headings
+
+
+# The first "ingredients" and the first "method"/"directions" of a recipe's
+# text start its sections
+SECTION_MARKERS = re.compile(r"(?i)\b(ingredients)\b|\b(method|directions)\b")
+SECTION_HEADINGS = {"ingredients": "Ingredients", "method": "Method"}
+
+
+def parse_recipe_sections(text):
+    # One scan over the text that stops once both markers are found. Returns
+    # [(section, text)] in text order: section is None for the text before
+    # the first marker, the marker words themselves are dropped.
+    found = {}
+    for match in SECTION_MARKERS.finditer(text):
+        found.setdefault("ingredients" if match.group(1) else "method", match.span())
+        if len(found) == len(SECTION_HEADINGS):
+            break
+    sections = []
+    section, pos = None, 0
+    for name, (start, end) in sorted(found.items(), key=lambda item: item[1]):
+        sections.append((section, text[pos:start]))
+        section, pos = name, end
+    sections.append((section, text[pos:]))
+    return sections
+
+
+def sections_to_html(sections):
+    parts = []
+    for section, text in sections:
+        if section:
+            parts.append(f"\n\n<h2>{SECTION_HEADINGS[section]}</h2>")
+        parts.append(text)
+    return "".join(parts).strip().replace("\n", "<br>")
+
+
+class Recipe:
+    # One recipe of a PDF: its page range [start, end), its text and the
+    # parsed sections. build_recipes() makes them once per document and every
+    # exporter takes them in place of the (title, start_page) headings.
+    # page_offsets are the page breaks within the text (None when unknown,
+    # e.g. for records written before they were spooled). Pickles as one flat tuple,
+    # without the sections (they are cheap to parse again and would double
+    # the payload).
+    __slots__ = (
+        "id",
+        "title",
+        "slug",
+        "source",
+        "start",
+        "end",
+        "text",
+        "page_offsets",
+        "_sections",
+    )
+
+    def __init__(
+        self,
+        id,
+        title,
+        slug,
+        source,
+        start,
+        end,
+        text,
+        page_offsets=None,
+        sections=None,
+    ):
+        self.id = id
+        self.title = title
+        self.slug = slug
+        self.source = source
+        self.start = start
+        self.end = end
+        self.text = text
+        self.page_offsets = page_offsets
+        self._sections = sections
+
+    def __reduce__(self):
+        return (
+            Recipe,
+            (
+                self.id,
+                self.title,
+                self.slug,
+                self.source,
+                self.start,
+                self.end,
+                self.text,
+                self.page_offsets,
+            ),
+        )
+
+    def __repr__(self):
+        return (
+            f"Recipe({self.id}, {self.title!r}, {self.source!r}, "
+            f"pages {self.start}-{self.end})"
+        )
+
+    @property
+    def sections(self):
+        if self._sections is None:
+            self._sections = parse_recipe_sections(self.text)
+        return self._sections
+
+    def page_texts(self):
+        offsets = self.page_offsets
+        if offsets is None:
+            return [self.text]
+        return [self.text[a:b] for a, b in zip(offsets, offsets[1:])]
+
+    def to_record(self):
+        record = {
+            "title": self.title,
+            "source": self.source,
+            "start": self.start,
+            "end": self.end,
+            "text": self.text,
+        }
+        if self.page_offsets is not None:
+            record["pages"] = list(self.page_offsets)
+        return record
+
+    @classmethod
+    def from_record(cls, record, id=None, slugs=None):
+        title, source = record["title"], record["source"]
+        slug = sanitize_title(title) if slugs is None else slugs.slug(title, source)
+        pages = record.get("pages")
+        return cls(
+            id,
+            title,
+            slug,
+            source,
+            record["start"],
+            record["end"],
+            record["text"],
+            None if pages is None else tuple(pages),
+        )
+
+
+def build_recipes(doc, headings, source=None, cache=None, slugs=None):
+    cache = _page_cache(doc, cache)
+    if source is None:
+        source = os.path.basename(getattr(cache.doc, "name", "") or "")
+    slugs = SlugRegistry() if slugs is None else slugs
+    recipes = []
+    for i, (title, start, end) in enumerate(_recipe_ranges(headings, len(cache))):
+        texts = [cache.page_text(p) for p in range(start, end)]
+        offsets = tuple(itertools.accumulate(map(len, texts), initial=0))
+        slug = slugs.slug(title, source)
+        text = "".join(texts)
+        recipes.append(Recipe(i, title, slug, source, start, end, text, offsets))
+    return recipes
+
+
+def _recipe_ranges(headings, page_count):
+    # (title, start, end) of Recipes or of (title, start_page) headings
+    if headings and isinstance(headings[0], Recipe):
+        return [(recipe.title, recipe.start, recipe.end) for recipe in headings]
+    return [
+        (title, start, headings[i + 1][1] if i + 1 < len(headings) else page_count)
+        for i, (title, start) in enumerate(headings)
+    ]
+
+
+def _recipe_slugs(headings, slugs=None, source=None):
+    # Slugs of Recipes, or of one book's (title, start_page) headings as
+    # looked up in its SlugRegistry (by default a new one)
+    if headings and isinstance(headings[0], Recipe):
+        return [recipe.slug for recipe in headings]
+    slugs = SlugRegistry() if slugs is None else slugs
+    return [slugs.slug(title, source) for title, _ in headings]
+
+
+def _as_recipes(doc, headings, cache=None, source=None):
+    # No headings means no recipes, whether or not there is a document
+    if not headings:
+        return []
+    if isinstance(headings[0], Recipe):
+        return headings
+    return build_recipes(doc, headings, source, cache)
+
+
+def split_recipes(doc, headings, out_dir, writer=None):
+    return save_split_recipes(render_split_recipes(doc, headings), out_dir, writer)
+
+
+def render_split_recipes(doc, headings, slugs=None, source=None):
+    # (slug, PDF bytes) per recipe, rendered in memory so that writing the
+    # files can happen off the thread that does the fitz work. No new /ID is
+    # drawn, so the same pages always give the same bytes.
+    ranges = _recipe_ranges(headings, len(doc))
+    names = _recipe_slugs(headings, slugs, source)
+    for slug, (_, start_page, end_page) in zip(names, ranges):
         new_doc = fitz.open()
         new_doc.insert_pdf(doc, from_page=start_page, to_page=end_page - 1)
+        yield slug, new_doc.tobytes(no_new_id=True)
+        new_doc.close()
+
 
-        safe_title = sanitize_title(title)
-        out_path = os.path.join(out_dir, f"{safe_title}.pdf")
-        new_doc.save(out_path)
-    return f"✅ Split {len(headings)} recipes to: {out_dir}"
+def save_split_recipes(split_pdfs, out_dir, writer=None):
+    os.makedirs(out_dir, exist_ok=True)
+    count = 0
+    for slug, data in split_pdfs:
+        _write_output(os.path.join(out_dir, f"{slug}.pdf"), data, writer)
+        count += 1
+    return f"✅ Split {count} recipes to: {out_dir}"
 
 
-def generate_toc(headings, out_path):
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write("## Table of Contents\n\n")
-        for i, (title, _) in enumerate(headings, 1):
-            safe_title = sanitize_title(title)
-            f.write(f"{i}. [{title}](cookbook_site/recipes/{safe_title}.html)\n")
+def generate_toc(headings, out_path, writer=None, slugs=None):
+    # Links go to the master site's recipe pages: pass its SlugRegistry as
+    # `slugs` with the site's (title, source) pairs as `headings`. Recipes
+    # or one book's (title, page) headings work without one.
+    if headings and isinstance(headings[0], Recipe):
+        headings = [(recipe.title, recipe.source) for recipe in headings]
+    elif slugs is None:
+        headings = [(title, None) for title, _ in headings]  # a page is no source
+    slugs = SlugRegistry(headings) if slugs is None else slugs
+    toc = "## Table of Contents\n\n"
+    for i, (title, key) in enumerate(headings, 1):
+        toc += f"{i}. [{title}](cookbook_site/recipes/{slugs.slug(title, key)}.html)\n"
+    _write_output(out_path, toc, writer)
     return f"📘 TOC written to: {out_path}"
 
 
-def build_ingredient_index(doc, headings):
-    index = defaultdict(set)
-    for i, (title, start) in enumerate(headings):
-        end = headings[i + 1][1] if i + 1 < len(headings) else len(doc)
-        text = ""
-        for p in range(start, end):
-            text += doc[p].get_text("text")
+# Words never indexed as ingredients (besides words of one or two letters)
+INGREDIENT_STOP_WORDS = frozenset(
+    {"cup", "cups", "tsp", "tbsp", "grams", "ml", "oz", "and", "with", "for", "the"}
+)
 
-        matches = re.findall(r"\b[a-zA-Z][a-zA-Z]+\b", text)
-        for word in matches:
-            word = word.lower()
-            if (
-                word
-                not in {
-                    "cup",
-                    "cups",
-                    "tsp",
-                    "tbsp",
-                    "grams",
-                    "ml",
-                    "oz",
-                    "and",
-                    "with",
-                    "for",
-                    "the",
-                }
-                and len(word) > 2
-            ):
-                index[word].add(title)
-    return index
 
+class _IndexQueries(Mapping):
+    # Queries shared by IngredientIndex and MappedIndex, which provide
+    # `recipes` ((title, source) by id) and postings(word). As a mapping an
+    # index reads like the old {word: set of titles}: index[word] is the
+    # sorted list of distinct titles.
+    def __getitem__(self, word):
+        ids = self.postings(word)
+        if not ids:
+            raise KeyError(word)
+        recipes = self.recipes
+        return sorted({recipes[rid][0] for rid in ids})
+
+    def titles(self, ids):
+        return [self.recipes[rid][0] for rid in ids]
+
+    def intersection(self, *words):
+        return intersect_postings([self.postings(word) for word in words])
+
+    def union(self, *words):
+        return union_postings([self.postings(word) for word in words])
+
+    def find_recipes(self, include=(), exclude=(), any_of=()):
+        # Ids of the recipes with every `include` word, at least one `any_of`
+        # word (when given) and no `exclude` word, in id order; e.g.
+        # find_recipes(["chicken", "lemon"], exclude=["nuts"]). Words are
+        # matched lowercased. Use titles() or .recipes to look the ids up.
+        any_of = [self.postings(word.lower()) for word in any_of]
+        if include:
+            ids = intersect_postings([self.postings(w.lower()) for w in include])
+            # (a OR b) only needs looking up within the include matches
+            if any_of and ids:
+                ids = union_postings([intersect_postings([ids, p]) for p in any_of])
+        elif any_of:
+            ids = union_postings(any_of)
+        else:
+            ids = array("I", range(len(self.recipes)))
+        if exclude and ids:
+            ids = subtract_postings(ids, [self.postings(w.lower()) for w in exclude])
+        return ids
+
+
+class IngredientIndex(_IndexQueries):
+    # Inverted ingredient index over dense recipe ids: `recipes` lists the
+    # (title, source) of each id and every word has a sorted array('I') of
+    # the ids whose text contains it, so the index costs 4 bytes per posting
+    # instead of a title string reference in a set per word. postings(),
+    # intersection(), union() and find_recipes() work on ids.
+    def __init__(self, recipes=(), postings=None):
+        self.recipes = list(recipes)
+        self._postings = {} if postings is None else postings
+
+    @classmethod
+    def from_recipes(cls, recipes, stop_words=INGREDIENT_STOP_WORDS):
+        index = cls()
+        postings = index._postings
+        for recipe in recipes:
+            rid = len(index.recipes)
+            index.recipes.append((recipe.title, recipe.source))
+            words = {
+                word.lower()
+                for word in re.findall(r"\b[a-zA-Z][a-zA-Z]+\b", recipe.text)
+            }
+            words = {word for word in words if len(word) > 2}.difference(stop_words)
+            # ids only grow, so every posting list stays sorted
+            for word in words:
+                ids = postings.get(word)
+                if ids is None:
+                    ids = postings[word] = array("I")
+                ids.append(rid)
+        return index
+
+    def merge(self, *others):
+        # A new index with the recipes of self, then those of each of
+        # `others` with their ids shifted past the ones before them, so every
+        # posting list stays sorted by plain concatenation. Linear in the
+        # total number of postings and associative: per-PDF shards built in
+        # separate processes can be reduced in any grouping, e.g. in a tree.
+        recipes = list(self.recipes)
+        postings = {word: ids[:] for word, ids in self._postings.items()}
+        for other in others:
+            offset = len(recipes)
+            recipes.extend(other.recipes)
+            for word, ids in other._postings.items():
+                ids = array("I", [rid + offset for rid in ids]) if offset else ids[:]
+                merged = postings.get(word)
+                if merged is None:
+                    postings[word] = ids
+                else:
+                    merged.extend(ids)
+        return IngredientIndex(recipes, postings)
+
+    def remove_source(self, source):
+        # A new index without the recipes of `source`; the others keep their
+        # order and are renumbered densely. Words left without recipes go.
+        keep = [rid for rid, (_, src) in enumerate(self.recipes) if src != source]
+        new_ids = [None] * len(self.recipes)
+        for new_id, rid in enumerate(keep):
+            new_ids[rid] = new_id
+        postings = {}
+        for word, ids in self._postings.items():
+            ids = [new_ids[rid] for rid in ids if new_ids[rid] is not None]
+            if ids:
+                postings[word] = array("I", ids)
+        return IngredientIndex([self.recipes[rid] for rid in keep], postings)
+
+    def to_record(self):
+        # JSON form for the build manifest
+        return {
+            "recipes": [list(recipe) for recipe in self.recipes],
+            "postings": {word: ids.tolist() for word, ids in self._postings.items()},
+        }
 
-def save_index(index, out_path):
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write("## Ingredient Index\n\n")
-        for ingredient in sorted(index):
-            titles = ", ".join(sorted(index[ingredient]))
-            f.write(f"- **{ingredient}** → {titles}\n")
+    @classmethod
+    def from_record(cls, record):
+        return cls(
+            [tuple(recipe) for recipe in record["recipes"]],
+            {word: array("I", ids) for word, ids in record["postings"].items()},
+        )
+
+    def __iter__(self):
+        return iter(self._postings)
+
+    def __len__(self):
+        return len(self._postings)
+
+    def __contains__(self, word):
+        return word in self._postings
+
+    def postings(self, word):
+        return self._postings.get(word, _NO_POSTINGS)
+
+    def memory_footprint(self):
+        # Bytes held by the index, by part (shared title/source strings are
+        # counted once)
+        postings = sum(sys.getsizeof(ids) for ids in self._postings.values())
+        vocabulary = sys.getsizeof(self._postings) + sum(
+            sys.getsizeof(word) for word in self._postings
+        )
+        strings = {id(s): s for recipe in self.recipes for s in recipe}
+        recipes = (
+            sys.getsizeof(self.recipes)
+            + sum(sys.getsizeof(recipe) for recipe in self.recipes)
+            + sum(sys.getsizeof(s) for s in strings.values())
+        )
+        return {
+            "postings": postings,
+            "vocabulary": vocabulary,
+            "recipes": recipes,
+            "total": postings + vocabulary + recipes,
+        }
+
+
+_NO_POSTINGS = array("I")
+
+
+def intersect_postings(lists):
+    # Ids in all of the sorted posting lists, shortest list first
+    if not lists:
+        return array("I")
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        if not result:
+            break
+        result = _filter_postings(result, other, True)
+    return array("I", result)
+
+
+def union_postings(lists):
+    lists = [ids for ids in lists if ids]
+    if np is not None and sum(map(len, lists)) > 256:
+        return _as_postings(np.unique(np.concatenate([_np_postings(i) for i in lists])))
+    return array("I", sorted(set().union(*lists)))
+
+
+def subtract_postings(ids, lists):
+    # Ids not in any of the sorted posting lists
+    for other in lists:
+        if not ids:
+            break
+        if other:
+            ids = _filter_postings(ids, other, False)
+    return ids
+
+
+def _filter_postings(ids, other, found):
+    # The ids that are (found=True) or are not in `other`; both sorted. A
+    # short `ids` probes a much longer list by binary search instead of
+    # reading all of it; otherwise numpy (if installed) or a set does the
+    # membership test.
+    if len(ids) * 16 < len(other):
+        keep, lo, n = [], 0, len(other)
+        for rid in ids:
+            lo = bisect_left(other, rid, lo)
+            if (lo < n and other[lo] == rid) == found:
+                keep.append(rid)
+        return array("I", keep)
+    if np is not None and len(ids) > 64:
+        a, b = _np_postings(ids), _np_postings(other)
+        pos = np.searchsorted(b, a)
+        pos[pos == len(b)] = 0
+        mask = b[pos] == a
+        return _as_postings(a[mask if found else ~mask])
+    members = set(other)
+    return array("I", [rid for rid in ids if (rid in members) == found])
+
+
+def _np_postings(ids):
+    return np.frombuffer(ids, dtype=np.uintc)
+
+
+def _as_postings(values):
+    ids = array("I")
+    ids.frombytes(values.astype(np.uintc, copy=False).tobytes())
+    return ids
+
+
+# Binary ingredient index (save_index format="binary"), all little-endian:
+#   header: magic, version, counts of recipes, sources and words, then the
+#           start of each section below (u64, 8-byte aligned)
+#   recipe_sources  u32 per recipe, its source's number
+#   titles, sources, words
+#                   string tables: u64 offsets (count + 1) into a utf-8 blob;
+#                   words are sorted, so a lookup is a binary search
+#   counts          u32 per word, the length of its posting list
+#   postings        u64 offsets (words + 1) into the postings blob, where
+#                   each word's ids are delta + varint (LEB128) encoded
+INDEX_MAGIC = b"CKIX"
+INDEX_FORMAT = 1
+_INDEX_HEADER = struct.Struct("<4sIIII4x10Q")
+_INDEX_SECTIONS = (
+    "recipe_sources",
+    "title_offsets",
+    "title_blob",
+    "source_offsets",
+    "source_blob",
+    "word_offsets",
+    "word_blob",
+    "counts",
+    "posting_offsets",
+    "posting_blob",
+)
+
+
+def _varint_deltas(ids):
+    data, prev = bytearray(), 0
+    for rid in ids:
+        delta, prev = rid - prev, rid
+        while delta > 0x7F:
+            data.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return data
+
+
+def _decode_postings(data):
+    # Inverse of _varint_deltas
+    if np is not None and len(data) > 64:
+        b = np.frombuffer(data, dtype=np.uint8)
+        ends = np.flatnonzero(b < 0x80)
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        shifts = np.arange(len(b)) - np.repeat(starts, ends - starts + 1)
+        values = (b & 0x7F).astype(np.uint64) << (shifts * 7).astype(np.uint64)
+        return _as_postings(np.cumsum(np.add.reduceat(values, starts)))
+    ids, rid, value, shift = array("I"), 0, 0, 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            rid += value
+            ids.append(rid)
+            value = shift = 0
+    return ids
+
+
+def _string_table(strings):
+    blobs = [string.encode("utf-8") for string in strings]
+    offsets = itertools.accumulate(map(len, blobs), initial=0)
+    return struct.pack(f"<{len(blobs) + 1}Q", *offsets), b"".join(blobs)
+
+
+def _index_bytes(index):
+    # The binary format of an IngredientIndex (or MappedIndex)
+    sources = {}
+    recipe_sources = [sources.setdefault(src, len(sources)) for _, src in index.recipes]
+    words = sorted(index)
+    postings = [_varint_deltas(index.postings(word)) for word in words]
+    title_offsets, title_blob = _string_table(title for title, _ in index.recipes)
+    source_offsets, source_blob = _string_table(sources)
+    word_offsets, word_blob = _string_table(words)
+    posting_offsets = itertools.accumulate(map(len, postings), initial=0)
+    sections = [
+        struct.pack(f"<{len(recipe_sources)}I", *recipe_sources),
+        title_offsets,
+        title_blob,
+        source_offsets,
+        source_blob,
+        word_offsets,
+        word_blob,
+        struct.pack(f"<{len(words)}I", *(len(index.postings(w)) for w in words)),
+        struct.pack(f"<{len(words) + 1}Q", *posting_offsets),
+        b"".join(postings),
+    ]
+    starts, pos = [], _INDEX_HEADER.size
+    for section in sections:
+        starts.append(pos)
+        pos += -(-len(section) // 8) * 8
+    counts = (len(recipe_sources), len(sources), len(words))
+    header = _INDEX_HEADER.pack(INDEX_MAGIC, INDEX_FORMAT, *counts, *starts)
+    return header + b"".join(
+        section + bytes(-len(section) % 8) for section in sections
+    )
+
+
+class MappedIndex(_IndexQueries):
+    # Read-only ingredient index over a file written by save_index(...,
+    # format="binary"). The file is mmap'ed and nothing is decoded up front:
+    # a word is found by binary search over the sorted vocabulary and only
+    # its posting list is decoded, so opening is instant whatever the size.
+    # Answers the same queries as IngredientIndex (find_recipes, index[word]).
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_recipes, _, n_words, *starts = (
+            _INDEX_HEADER.unpack_from(self._mm)
+        )
+        if magic != INDEX_MAGIC or version != INDEX_FORMAT:
+            self._mm.close()
+            raise ValueError(f"{path} is not a format {INDEX_FORMAT} ingredient index")
+        self._n_words = n_words
+        self._at = dict(zip(_INDEX_SECTIONS, starts))
+        self.recipes = _MappedRecipes(self, n_recipes)
+
+    def _u32(self, section, i):
+        return struct.unpack_from("<I", self._mm, self._at[section] + 4 * i)[0]
+
+    def _span(self, section, i):
+        return struct.unpack_from("<2Q", self._mm, self._at[section] + 8 * i)
+
+    def _bytes(self, table, i):
+        start, end = self._span(f"{table}_offsets", i)
+        blob = self._at[f"{table}_blob"]
+        return self._mm[blob + start : blob + end]
+
+    def _string(self, table, i):
+        return self._bytes(table, i).decode("utf-8")
+
+    def _find(self, word):
+        # utf-8 sorts like str, so the search compares the raw bytes
+        key = word.encode("utf-8")
+        lo, hi = 0, self._n_words
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes("word", mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._n_words and self._bytes("word", lo) == key:
+            return lo
+        return None
+
+    def __iter__(self):
+        return (self._string("word", i) for i in range(self._n_words))
+
+    def __len__(self):
+        return self._n_words
+
+    def __contains__(self, word):
+        return isinstance(word, str) and self._find(word) is not None
+
+    def count(self, word):
+        # Length of the word's posting list, without decoding it
+        i = self._find(word)
+        return 0 if i is None else self._u32("counts", i)
+
+    def postings(self, word):
+        i = self._find(word)
+        if i is None:
+            return _NO_POSTINGS
+        start, end = self._span("posting_offsets", i)
+        blob = self._at["posting_blob"]
+        return _decode_postings(self._mm[blob + start : blob + end])
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _MappedRecipes(Sequence):
+    # MappedIndex.recipes: (title, source) by id, read from the file on access
+    def __init__(self, index, n_recipes):
+        self._index = index
+        self._n = n_recipes
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, rid):
+        if not 0 <= rid < self._n:
+            raise IndexError(rid)
+        index = self._index
+        source = index._u32("recipe_sources", rid)
+        return index._string("title", rid), index._string("source", source)
+
+
+def build_ingredient_index(doc, headings, cache=None, stop_words=INGREDIENT_STOP_WORDS):
+    return IngredientIndex.from_recipes(_as_recipes(doc, headings, cache), stop_words)
+
+
+def save_index(index, out_path, writer=None, format="markdown"):
+    # format="binary" writes the IngredientIndex for MappedIndex instead
+    if format == "binary":
+        _write_output(out_path, _index_bytes(index), writer)
+        return f"🥕 Binary ingredient index saved to: {out_path}"
+    lines = ["## Ingredient Index\n\n"]
+    for ingredient in sorted(index):
+        titles = ", ".join(sorted(index[ingredient]))
+        lines.append(f"- **{ingredient}** → {titles}\n")
+    _write_output(out_path, "".join(lines), writer)
     return f"🥕 Ingredient index saved to: {out_path}"
 
 
-def export_to_html(doc, headings, index, html_dir):
+def export_to_html(doc, headings, index, html_dir, cache=None, writer=None):
+    recipes = _as_recipes(doc, headings, cache)
+    return export_recipes_to_html(recipes, index, html_dir, writer)
+
+
+def export_recipes_to_html(recipes, index, html_dir, writer=None):
     os.makedirs(html_dir, exist_ok=True)
 
-    toc_path = os.path.join(html_dir, "index.html")
-    with open(toc_path, "w", encoding="utf-8") as f:
-        f.write("<h1>Recipe Index</h1>\n<ul>\n")
-        for title, _ in headings:
-            filename = sanitize_title(title) + ".html"
-            f.write(f'<li><a href="{filename}">{title}</a></li>\n')
-        f.write("</ul>\n")
-
-    for i, (title, start_page) in enumerate(headings):
-        end_page = headings[i + 1][1] if i + 1 < len(headings) else len(doc)
-        html_filename = sanitize_title(title) + ".html"
-        out_path = os.path.join(html_dir, html_filename)
-
-        with open(out_path, "w", encoding="utf-8") as f:
-            f.write(f"<h1>{title}</h1>\n")
-            for p in range(start_page, end_page):
-                f.write("<pre>\n" + doc[p].get_text("text") + "\n</pre>\n")
-
-    index_path = os.path.join(html_dir, "ingredients.html")
-    with open(index_path, "w", encoding="utf-8") as f:
-        f.write("<h1>Ingredient Index</h1>\n<ul>\n")
-        for ingredient in sorted(index):
-            refs = ", ".join(index[ingredient])
-            f.write(f"<li><strong>{ingredient}</strong>: {refs}</li>\n")
-        f.write("</ul>\n")
+    toc = ["<h1>Recipe Index</h1>\n<ul>\n"]
+    for recipe in recipes:
+        filename = recipe.slug + ".html"
+        toc.append(f'<li><a href="{filename}">{recipe.title}</a></li>\n')
+    toc.append("</ul>\n")
+    _write_output(os.path.join(html_dir, "index.html"), "".join(toc), writer)
+
+    for recipe in recipes:
+        out_path = os.path.join(html_dir, recipe.slug + ".html")
+        page = [f"<h1>{recipe.title}</h1>\n"]
+        for text in recipe.page_texts():
+            page.append("<pre>\n" + text + "\n</pre>\n")
+        _write_output(out_path, "".join(page), writer)
+
+    refs_list = ["<h1>Ingredient Index</h1>\n<ul>\n"]
+    for ingredient in sorted(index):
+        refs = ", ".join(index[ingredient])
+        refs_list.append(f"<li><strong>{ingredient}</strong>: {refs}</li>\n")
+    refs_list.append("</ul>\n")
+    refs_path = os.path.join(html_dir, "ingredients.html")
+    _write_output(refs_path, "".join(refs_list), writer)
 
     return f"🌐 HTML cookbook created at: {html_dir}"
 
 
+def iter_recipe_records(doc, headings, source, cache=None):
+    # Lightweight per-recipe records: all the master site needs from a PDF
+    for recipe in _as_recipes(doc, headings, cache, source):
+        yield recipe.to_record()
+
+
+def iter_library_records(pdf_paths, store=None, profile="text", heuristics=None):
+    # Streams the records of many PDFs with only one document open at a time.
+    # A store is flushed after each PDF, so its pending pages don't pile up.
+    for path in pdf_paths:
+        doc = load_pdf(path)
+        try:
+            cache = PageTextCache(doc, store, profile=profile)
+            headings = detect_headings(doc, cache, heuristics=heuristics)
+            yield from iter_recipe_records(
+                doc, headings, os.path.basename(path), cache
+            )
+        finally:
+            doc.close()
+        if store is not None:
+            store.flush()
+
+
+def save_records(records, path, writer=None):
+    lines = [json.dumps(record, ensure_ascii=False) + "\n" for record in records]
+    _write_output(path, "".join(lines), writer)
+
+
+def load_records(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
 def export_master_html_site(
-    all_docs, all_headings, all_indexes, out_dir, recipe_sources
+    all_docs,
+    all_headings,
+    all_indexes,
+    out_dir,
+    recipe_sources,
+    writer=None,
+    slugs=None,
 ):
-    os.makedirs(out_dir, exist_ok=True)
-    recipes_dir = os.path.join(out_dir, "recipes")
-    os.makedirs(recipes_dir, exist_ok=True)
+    # Entries may carry a PageTextCache in place of the document so that pages
+    # already extracted by earlier stages are not parsed again, and Recipes in
+    # place of the headings.
+    records = itertools.chain.from_iterable(
+        _as_recipes(doc, headings, source=source) for doc, headings, source in all_docs
+    )
+    return export_master_html_records(
+        records, all_headings, all_indexes, out_dir, recipe_sources, writer, slugs
+    )
 
-    search_records = []
 
-    def wrap_html(title, body, stylesheet="../style.css"):
-        return f"""<!DOCTYPE html>
+def wrap_html(title, body, stylesheet="../style.css"):
+    return f"""<!DOCTYPE html>
 <html lang="en">
 <head>
   <meta charset="UTF-8">
@@ -178,27 +2000,41 @@ def export_master_html_site(
 </body>
 </html>"""
 
-    for doc, headings, source in all_docs:
-        for i, (title, start) in enumerate(headings):
-            end = headings[i + 1][1] if i + 1 < len(headings) else len(doc)
-            recipe_text = ""
-            for p in range(start, end):
-                recipe_text += doc[p].get_text("text")
-                parsed = re.sub(
-                    r"(?i)\bingredients\b",
-                    "\n\n<h2>Ingredients</h2>",
-                    recipe_text,
-                    count=1,
-                )
-                parsed = re.sub(
-                    r"(?i)\bmethod\b|\bdirections\b",
-                    "\n\n<h2>Method</h2>",
-                    parsed,
-                    count=1,
-                )
 
-            html_filename = sanitize_title(title) + ".html"
-            filepath = os.path.join(recipes_dir, html_filename)
+def export_master_html_records(
+    records,
+    all_headings,
+    all_indexes,
+    out_dir,
+    recipe_sources,
+    writer=None,
+    slugs=None,
+):
+    # Consumes records (dicts or Recipes) one at a time, e.g. straight from
+    # iter_library_records or load_records, so no document or full recipe
+    # list is held in memory. `all_headings` lists (title, source) in the
+    # same order as `records`. With all_indexes=None the ingredient page is
+    # left to export_master_ingredient_index. search_data.js is streamed to
+    # disk here; every other page goes through `writer` when one is given.
+    # Every recipe gets a page of its own, named by `slugs` (by default a
+    # SlugRegistry over all_headings).
+    os.makedirs(out_dir, exist_ok=True)
+    recipes_dir = os.path.join(out_dir, "recipes")
+    os.makedirs(recipes_dir, exist_ok=True)
+    slugs = SlugRegistry(all_headings) if slugs is None else slugs
+
+    search_path = os.path.join(recipes_dir, "search_data.js")
+    search_tmp = search_path + ".tmp"
+    with open(search_tmp, "w", encoding="utf-8") as search_file:
+        search_file.write("window.searchData = ")
+        count = 0
+        for record in records:
+            recipe = record
+            if not isinstance(recipe, Recipe):
+                recipe = Recipe.from_record(record, slugs=slugs)
+            title, source = recipe.title, recipe.source
+            recipe_text = recipe.text
+            html_filename = slugs.slug(title, source) + ".html"
 
             body = f"<h1>{title}</h1>\n"
             body += f"<p><em>From: {source}</em></p>\n"
@@ -211,33 +2047,35 @@ def export_master_html_site(
                 body += f'<p><strong>Also found in:</strong> {", ".join(sorted(other_sources))}</p>\n'
 
             body += '<p><a href="../index.html">← Back to Index</a> | <a href="../ingredients.html">Ingredient Index</a></p>\n'
-            # body += f"<pre>\n{recipe_text.strip()}\n</pre>\n"
-            html_recipe = parsed.strip().replace("\n", "<br>")
+            html_recipe = sections_to_html(recipe.sections)
             body += f"{html_recipe}\n"
 
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(wrap_html(title, body))
+            filepath = os.path.join(recipes_dir, html_filename)
+            _write_output(filepath, wrap_html(title, body), writer)
 
-            search_records.append(
-                {
-                    "title": title,
-                    "source": source,
-                    "url": f"recipes/{html_filename}",
-                    "body": recipe_text,
-                }
+            # Streamed equivalent of json.dump(search_records, f, indent=2)
+            search_record = {
+                "title": title,
+                "source": source,
+                "url": f"recipes/{html_filename}",
+                "body": recipe_text,
+            }
+            search_file.write("[\n" if count == 0 else ",\n")
+            search_file.write(
+                "\n".join(
+                    "  " + line for line in json.dumps(search_record, indent=2).split("\n")
+                )
             )
-
-    with open(os.path.join(recipes_dir, "search_data.js"), "w", encoding="utf-8") as f:
-        f.write("window.searchData = ")
-        json.dump(search_records, f, indent=2)
-        f.write(";")
+            count += 1
+        search_file.write("\n];" if count else "[];")
+    _replace_if_changed(search_tmp, search_path)
 
     toc_body = """
 <h1>Master Recipe Index</h1>
 <input type="text" id="searchInput" placeholder="Search recipes..." oninput="runSearch()" style="width:100%; padding:0.5em; margin-bottom:1em;">
 <ul id="searchResults">\n"""
     for title, source in all_headings:
-        filename = sanitize_title(title) + ".html"
+        filename = slugs.slug(title, source) + ".html"
         toc_body += f'<li><a href="recipes/{filename}">{title}</a> <small>({source})</small></li>\n'
     toc_body += "</ul>\n"
     toc_body += """
@@ -259,17 +2097,864 @@ function runSearch() {
 </script>
 """
 
-    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
-        f.write(wrap_html("Master TOC", toc_body, stylesheet="style.css"))
+    _write_output(
+        os.path.join(out_dir, "index.html"),
+        wrap_html("Master TOC", toc_body, stylesheet="style.css"),
+        writer,
+    )
+
+    if all_indexes is not None:
+        export_master_ingredient_index(all_indexes, out_dir, writer)
 
-    # Build ingredient index
+    return f"📚 Styled HTML cookbook site with full-text search saved to: {out_dir}"
+
+
+def export_master_ingredient_index(all_indexes, out_dir, writer=None):
+    os.makedirs(out_dir, exist_ok=True)
     index_body = "<h1>Master Ingredient Index</h1><ul>\n"
     for ingredient in sorted(all_indexes):
         refs = ", ".join(sorted(all_indexes[ingredient]))
         index_body += f"<li><strong>{ingredient}</strong>: {refs}</li>\n"
     index_body += "</ul>"
 
-    with open(os.path.join(out_dir, "ingredients.html"), "w", encoding="utf-8") as f:
-        f.write(wrap_html("Ingredient Index", index_body, stylesheet="style.css"))
+    _write_output(
+        os.path.join(out_dir, "ingredients.html"),
+        wrap_html("Ingredient Index", index_body, stylesheet="style.css"),
+        writer,
+    )
 
-    return f"📚 Styled HTML cookbook site with full-text search saved to: {out_dir}"
+
+# Bump whenever the title rules change in code, so that every PDF's headings
+# are detected again (TitleHeuristics settings are part of the stage key)
+HEURISTICS_VERSION = "1"
+MANIFEST_NAME = "build_manifest.json"
+
+# The build graph:
+#
+#   extract -> headings -> recipes -> index -> master_index
+#                 |           |         '--> catalog (also reads recipes)
+#                 |           |-----> site
+#                 |           '-----> master_site
+#                 '-> split
+#
+# Every stage's cache key hashes its code version (below), its config and the
+# keys of its inputs, so a change reruns that stage and the stages below it
+# and nothing else: a new stop-word list reruns index, catalog and
+# master_index. The catalog keeps each PDF's key in the database itself.
+# headings hands on a digest of the headings it found rather than its key,
+# so a heuristics change that finds the same recipes stops there. extract is
+# cached by the ExtractionStore. Bump a stage's version when its code changes.
+STAGE_VERSIONS = {
+    "extract": "2",
+    "headings": HEURISTICS_VERSION,
+    "recipes": "1",
+    "split": "2",
+    "index": "2",
+    "site": "2",
+    "master_site": "3",
+    "master_index": "2",
+    "catalog": "1",
+}
+
+
+def stage_key(stage, config, inputs):
+    node = [stage, STAGE_VERSIONS[stage], config, inputs]
+    encoded = json.dumps(node, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def _pdf_stage_keys(sha256, profile, heuristics, stop_words, headings=None):
+    # Stage keys of one PDF. The stages after headings depend on what it
+    # found, so without `headings` only the first two keys are known.
+    keys = {"extract": stage_key("extract", {"sha256": sha256, "profile": profile}, [])}
+    keys["headings"] = stage_key("headings", heuristics.config(), [keys["extract"]])
+    if headings is None:
+        return keys
+    found = hashlib.sha256(
+        json.dumps([list(h) for h in headings], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:16]
+    keys["recipes"] = stage_key("recipes", None, [keys["extract"], found])
+    keys["split"] = stage_key("split", None, [keys["extract"], found])
+    keys["index"] = stage_key("index", sorted(stop_words), [keys["recipes"]])
+    keys["site"] = stage_key("site", None, [keys["recipes"]])
+    keys["catalog"] = stage_key("catalog", None, [keys["recipes"], keys["index"]])
+    return keys
+
+
+def _stage_is_fresh(output_base, entry, stage, key):
+    # Same key as in the last build and all of the stage's files still there
+    return entry.get("stages", {}).get(stage) == key and all(
+        os.path.exists(os.path.join(output_base, relpath))
+        for relpath in entry["outputs"].get(stage, [])
+    )
+
+
+def load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"pdfs": {}, "master": {}}
+
+
+def save_manifest(manifest, path):
+    write_if_changed(path, json.dumps(manifest, indent=1, sort_keys=True) + "\n")
+
+
+def _pdf_outputs(stem, headings, slugs=None, source=None):
+    # Files written by each stage of one PDF, relative to output_base
+    slugs = _recipe_slugs(headings, slugs, source)
+    return {
+        "recipes": [f"records/{stem}.jsonl"],
+        "split": [f"Split_{stem}/{slug}.pdf" for slug in slugs],
+        "site": [f"site_{stem}/index.html", f"site_{stem}/ingredients.html"]
+        + [f"site_{stem}/{slug}.html" for slug in slugs],
+    }
+
+
+def _master_outputs(all_headings_flat, slugs):
+    return {
+        "master_site": [
+            "TOC.md",
+            "cookbook_site/index.html",
+            "cookbook_site/recipes/search_data.js",
+        ]
+        + [
+            f"cookbook_site/recipes/{slugs.slug(title, source)}.html"
+            for title, source in all_headings_flat
+        ],
+        "master_index": [
+            "Index.md",
+            INDEX_FILE_NAME,
+            "cookbook_site/ingredients.html",
+        ],
+    }
+
+
+def _all_outputs(entry):
+    # Manifests written before the stage graph kept one flat list
+    outputs = entry.get("outputs", [])
+    if isinstance(outputs, dict):
+        return list(itertools.chain.from_iterable(outputs.values()))
+    return outputs
+
+
+def _remove_stale(output_base, old_outputs, new_outputs):
+    for relpath in set(old_outputs) - set(new_outputs):
+        try:
+            os.remove(os.path.join(output_base, relpath))
+        except FileNotFoundError:
+            pass
+
+
+def _extract_pdf(
+    pdf_path,
+    output_base,
+    store_path=None,
+    sha256=None,
+    profile="text",
+    heuristics=None,
+    stop_words=INGREDIENT_STOP_WORDS,
+    old_entry=None,
+    catalog_path=None,
+    catalog_key=None,
+    jobs=1,
+    writer=None,
+):
+    # First build phase of one PDF: decides which stages are stale and does
+    # all of their fitz work (heading detection, the page texts the recipes
+    # need, the split PDFs). The PDF is closed on return.
+    # catalog_key is the stage key the RecipeCatalog holds for this PDF;
+    # `jobs` processes detect its headings.
+    # The split PDFs are handed to `writer` one by one as they are rendered,
+    # so that no more than the writer's budget of them is held in memory.
+    heuristics = heuristics or DEFAULT_HEURISTICS
+    job = {
+        "filename": os.path.basename(pdf_path),
+        "stem": os.path.splitext(os.path.basename(pdf_path))[0],
+        "output_base": output_base,
+        "old_entry": old_entry or {},
+        "sha256": sha256,
+        "profile": profile,
+        "stop_words": stop_words,
+        "catalog_path": catalog_path,
+        "cache": None,
+        "ran": [],
+        "messages": [],
+    }
+    old_entry = job["old_entry"]
+    keys = _pdf_stage_keys(sha256, profile, heuristics, stop_words)
+    doc = cache = store = None
+
+    def open_pdf():
+        nonlocal doc, cache, store
+        if doc is None:
+            doc = load_pdf(pdf_path)
+            store = ExtractionStore(store_path) if store_path else None
+            cache = PageTextCache(doc, store, sha256, profile)
+        return doc, cache
+
+    try:
+        if _stage_is_fresh(output_base, old_entry, "headings", keys["headings"]):
+            headings = [tuple(heading) for heading in old_entry["headings"]]
+            duplicates = [tuple(duplicate) for duplicate in old_entry["duplicates"]]
+        else:
+            duplicates = []
+            headings = detect_headings(
+                *open_pdf(), jobs=jobs, heuristics=heuristics, suppressed=duplicates
+            )
+            job["ran"].append("headings")
+        keys = _pdf_stage_keys(sha256, profile, heuristics, stop_words, headings)
+        # The one SlugRegistry of this PDF, for every stage that names files
+        slugs = SlugRegistry([(title, job["filename"]) for title, _ in headings])
+        job["stale"] = {
+            stage
+            for stage in ("recipes", "split", "index", "site")
+            if not _stage_is_fresh(output_base, old_entry, stage, keys[stage])
+        }
+        if catalog_path and catalog_key != keys["catalog"]:
+            job["stale"].add("catalog")
+        if "recipes" in job["stale"]:
+            doc, cache = open_pdf()
+            for _, start, end in _recipe_ranges(headings, len(cache)):
+                cache.range_text(start, end)
+            job["cache"] = cache
+        if "split" in job["stale"]:
+            recipe_dir = os.path.join(output_base, f"Split_{job['stem']}")
+            split_pdfs = render_split_recipes(
+                open_pdf()[0], headings, slugs, job["filename"]
+            )
+            job["messages"].append(save_split_recipes(split_pdfs, recipe_dir, writer))
+            job["ran"].append("split")
+    finally:
+        if store is not None:
+            store.close()
+        if doc is not None:
+            doc.close()
+    job.update(keys=keys, headings=headings, duplicates=duplicates, slugs=slugs)
+    return job
+
+
+def _parse_pdf(job):
+    # Second phase, pure Python: the Recipes (from the page texts or from the
+    # spooled records) and the ingredient index
+    stale = job["stale"]
+    recipes = None
+    if "recipes" in stale:
+        cache = job.pop("cache")
+        recipes = build_recipes(
+            None, job["headings"], job["filename"], cache, job["slugs"]
+        )
+        job["ran"].append("recipes")
+    elif stale & {"index", "site", "catalog"}:
+        records_dir = os.path.join(job["output_base"], "records")
+        records_path = os.path.join(records_dir, f"{job['stem']}.jsonl")
+        recipes = [
+            Recipe.from_record(record, i, job["slugs"])
+            for i, record in enumerate(load_records(records_path))
+        ]
+    if "index" in stale:
+        index = IngredientIndex.from_recipes(recipes, job["stop_words"])
+        job["index"] = index.to_record()
+        job["ran"].append("index")
+    else:
+        job["index"] = job["old_entry"]["index"]
+    job["recipes"] = recipes
+    return job
+
+
+def _write_pdf(job, writer=None):
+    # Last phase: renders the PDF's files and writes them (or hands them to
+    # `writer`). Returns its manifest entry, the stages that ran and their
+    # messages.
+    stale, output_base, stem = job["stale"], job["output_base"], job["stem"]
+    recipes, messages = job["recipes"], job["messages"]
+    if "recipes" in stale:
+        records_path = os.path.join(output_base, "records", f"{stem}.jsonl")
+        records = (recipe.to_record() for recipe in recipes)
+        save_records(records, records_path, writer)
+    if "site" in stale:
+        html_dir = os.path.join(output_base, f"site_{stem}")
+        messages.append(export_recipes_to_html(recipes, {}, html_dir, writer))
+        job["ran"].append("site")
+    if "catalog" in stale:
+        index = IngredientIndex.from_record(job["index"])
+        with RecipeCatalog(job["catalog_path"]) as catalog:
+            catalog.replace_source(
+                job["filename"], recipes, index, job["keys"]["catalog"]
+            )
+        job["ran"].append("catalog")
+    entry = {
+        "sha256": job["sha256"],
+        "profile": job["profile"],
+        "stages": job["keys"],
+        "headings": job["headings"],
+        "duplicates": job["duplicates"],  # (title, page, first_page)
+        "index": job["index"],
+        "outputs": _pdf_outputs(stem, job["headings"], job["slugs"], job["filename"]),
+    }
+    return job["filename"], entry, job["ran"], job["messages"]
+
+
+def _build_pdf(*args):
+    # All per-PDF build phases in a row; runs inside a worker process
+    with OutputWriter() as writer:
+        return _write_pdf(_parse_pdf(_extract_pdf(*args, writer=writer)), writer)
+
+
+_DONE = object()
+
+
+def run_pipeline(items, first, *stages, maxsize=2):
+    # Runs every item through first() on the calling thread (so that, e.g.,
+    # all fitz work stays on one thread) and then through each of `stages`
+    # on a thread of its own. Bounded queues join the stages: one that falls
+    # behind blocks the stage before it instead of piling up work. Returns
+    # the final results in item order; the first exception raised by any
+    # stage is re-raised once the pipeline has drained.
+    queues = [queue.Queue(maxsize) for _ in stages]
+    results, errors = [], []
+
+    def worker(stage, inbox, outbox):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            if errors:
+                continue  # keep draining so that upstream never blocks
+            try:
+                item = stage(item)
+            except BaseException as exc:
+                errors.append(exc)
+                continue
+            if outbox is None:
+                results.append(item)
+            else:
+                outbox.put(item)
+        if outbox is not None:
+            outbox.put(_DONE)
+
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(stage, queues[i], queues[i + 1] if i + 1 < len(stages) else None),
+            daemon=True,
+        )
+        for i, stage in enumerate(stages)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for item in items:
+            if errors:
+                break
+            item = first(item)
+            if queues:
+                queues[0].put(item)
+            else:
+                results.append(item)
+    finally:
+        if queues:
+            queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def build_library(
+    input_dir,
+    output_base,
+    jobs=1,
+    cache_path="",
+    incremental=True,
+    profile="text",
+    heuristics=None,
+    stop_words=None,
+    catalog_path="",
+    log=print,
+):
+    # Build every PDF in input_dir, then the merged master site, TOC and index.
+    # The RecipeCatalog goes to catalog_path (default: output_base/catalog.sqlite;
+    # None for none).
+    # PDFs are processed in sorted order and merged in that order, so the
+    # output does not depend on the number of jobs. With incremental=True only
+    # the stages of the build graph whose inputs, config or code changed
+    # since the last build are rerun, and unchanged files are not rewritten.
+    heuristics = heuristics or DEFAULT_HEURISTICS
+    stop_words = INGREDIENT_STOP_WORDS if stop_words is None else frozenset(stop_words)
+    os.makedirs(os.path.join(output_base, "records"), exist_ok=True)
+    if cache_path == "":
+        cache_path = os.path.join(output_base, "extraction_cache.sqlite")
+    if cache_path:
+        ExtractionStore(cache_path).close()  # create the schema once, up front
+    if catalog_path == "":
+        catalog_path = os.path.join(output_base, CATALOG_NAME)
+    catalog_keys = {}
+    if catalog_path:
+        with RecipeCatalog(catalog_path) as catalog:
+            catalog_keys = catalog.stage_keys()
+
+    manifest_path = os.path.join(output_base, MANIFEST_NAME)
+    saved_manifest = load_manifest(manifest_path)
+    old_manifest = saved_manifest if incremental else load_manifest("")
+    manifest = {"pdfs": {}, "master": {}}
+
+    pdf_names = [
+        filename
+        for filename in sorted(os.listdir(input_dir))
+        if filename.lower().endswith(".pdf")
+    ]
+    stale, fresh, sha256s = [], [], {}
+    for filename in pdf_names:
+        sha256s[filename] = file_sha256(os.path.join(input_dir, filename))
+        entry = old_manifest["pdfs"].get(filename, {})
+        keys = _pdf_stage_keys(
+            sha256s[filename], profile, heuristics, stop_words, entry.get("headings")
+        )
+        # Fully up to date PDFs are not even handed to a worker
+        catalog_key = keys.get("catalog")
+        if (
+            "recipes" in keys
+            and (not catalog_path or catalog_keys.get(filename) == catalog_key)
+            and all(
+                _stage_is_fresh(output_base, entry, stage, key)
+                for stage, key in keys.items()
+                if stage not in ("extract", "catalog")
+            )
+        ):
+            fresh.append(filename)
+        else:
+            stale.append(filename)
+
+    # Jobs the stale PDFs leave idle go to their heading detection, so that
+    # rebuilding one big book still uses every core
+    detect_jobs = max(1, jobs // len(stale)) if stale else 1
+
+    def build_args(filename):
+        path = os.path.join(input_dir, filename)
+        return (
+            path,
+            output_base,
+            cache_path,
+            sha256s[filename],
+            profile,
+            heuristics,
+            stop_words,
+            old_manifest["pdfs"].get(filename),
+            catalog_path,
+            catalog_keys.get(filename) if incremental else None,
+            detect_jobs,
+        )
+
+    # Generated files are written in the background; the manifest is only
+    # saved once they are all on disk
+    with OutputWriter() as writer:
+        if jobs > 1 and len(stale) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = {
+                    name: pool.submit(_build_pdf, *build_args(name)) for name in stale
+                }
+                built = {name: future.result() for name, future in futures.items()}
+        else:
+            # In one process, pipeline the PDFs instead: the next PDF's
+            # extraction overlaps with this one's parsing and rendering
+            results = run_pipeline(
+                stale,
+                lambda name: _extract_pdf(*build_args(name), writer=writer),
+                _parse_pdf,
+                lambda job: _write_pdf(job, writer),
+            )
+            built = {result[0]: result for result in results}
+        for filename in fresh:
+            built[filename] = (filename, old_manifest["pdfs"][filename], [], [])
+        results = [built[filename] for filename in pdf_names]
+
+        all_headings_flat = []  # [(title, source_name)]
+        shards = []  # IngredientIndex per PDF
+        recipe_sources = defaultdict(set)  # normalized_title → set of filenames
+        stages_run = Counter()
+
+        for filename, entry, ran, messages in results:
+            for message in messages:
+                log(message)
+            stages_run.update(ran)
+            headings = [tuple(heading) for heading in entry["headings"]]
+            for title, _ in headings:
+                recipe_sources[normalize_title(title)].add(filename)
+            shards.append(IngredientIndex.from_record(entry["index"]))
+            all_headings_flat.extend([(title, filename) for title, _ in headings])
+
+            manifest["pdfs"][filename] = entry
+            old_entry = old_manifest["pdfs"].get(filename, {})
+            _remove_stale(output_base, _all_outputs(old_entry), _all_outputs(entry))
+
+        for filename, old_entry in old_manifest["pdfs"].items():
+            if filename not in manifest["pdfs"]:
+                _remove_stale(output_base, _all_outputs(old_entry), [])
+        removed = set(catalog_keys) - set(pdf_names)
+        if removed:
+            with RecipeCatalog(catalog_path) as catalog:
+                for filename in sorted(removed):
+                    catalog.remove_source(filename)
+        if stages_run["catalog"] or removed:
+            log(f"🗃️ Recipe catalog saved to: {catalog_path}")
+
+        # The master stages read the recipes (or the indexes) of every PDF
+        pdf_stages = [(name, manifest["pdfs"][name]["stages"]) for name in pdf_names]
+        master_keys = {
+            stage: stage_key(
+                stage, None, [[name, keys[source]] for name, keys in pdf_stages]
+            )
+            for stage, source in (
+                ("master_site", "recipes"),
+                ("master_index", "index"),
+            )
+        }
+        old_master = old_manifest["master"]
+        if not isinstance(old_master, dict):  # pre-stage-graph manifest
+            old_master = {"outputs": old_master}
+
+        def master_fresh(stage):
+            key = master_keys[stage]
+            return _stage_is_fresh(output_base, old_master, stage, key)
+
+        # One slug per recipe across the whole library. The slugs of the last
+        # build are kept, also with incremental=False, so that page URLs
+        # do not move.
+        saved_master = saved_manifest["master"]
+        previous_slugs = []
+        if isinstance(saved_master, dict):
+            previous_slugs = saved_master.get("slugs", [])
+        slugs = SlugRegistry(all_headings_flat, previous_slugs)
+        if catalog_path:
+            with RecipeCatalog(catalog_path) as catalog:
+                catalog.set_slugs(slugs)
+        master_html_dir = os.path.join(output_base, "cookbook_site")
+        if not master_fresh("master_site"):
+            writer.flush()  # the records spooled above
+            records_dir = os.path.join(output_base, "records")
+            stems = [os.path.splitext(name)[0] for name in pdf_names]
+            records = itertools.chain.from_iterable(
+                load_records(os.path.join(records_dir, f"{stem}.jsonl"))
+                for stem in stems
+            )
+            log(
+                export_master_html_records(
+                    records,
+                    all_headings_flat,
+                    None,
+                    master_html_dir,
+                    recipe_sources,
+                    writer,
+                    slugs,
+                )
+            )
+            toc_path = os.path.join(output_base, "TOC.md")
+            log(generate_toc(all_headings_flat, toc_path, writer, slugs))
+            stages_run["master_site"] += 1
+        if not master_fresh("master_index"):
+            index = IngredientIndex().merge(*shards)
+            export_master_ingredient_index(index, master_html_dir, writer)
+            index_path = os.path.join(output_base, "Index.md")
+            log(save_index(index, index_path, writer))
+            index_path = os.path.join(output_base, INDEX_FILE_NAME)
+            log(save_index(index, index_path, writer, format="binary"))
+            stages_run["master_index"] += 1
+
+        manifest["master"] = {
+            "stages": master_keys,
+            "outputs": _master_outputs(all_headings_flat, slugs),
+            "slugs": slugs.to_record(),
+        }
+        _remove_stale(
+            output_base, _all_outputs(old_master), _all_outputs(manifest["master"])
+        )
+    save_manifest(manifest, manifest_path)
+    if stages_run:
+        counts = [f"{stage} ×{n}" for stage, n in stages_run.items()]
+        log("🧩 Stages run: " + ", ".join(counts))
+    return (
+        f"🏁 Built {len(stale)} of {len(results)} cookbooks "
+        f"({len(fresh)} unchanged) into: {output_base}"
+    )
+
+
+SPAN_STORE_NAME = "spans.npz"
+CATALOG_NAME = "catalog.sqlite"
+INDEX_FILE_NAME = "Index.bin"
+
+
+def build_span_library(input_dir, output_base, profile="text", use_cache=True):
+    # Write output_base/spans.npz for heuristic tuning. Page extraction goes
+    # through the build's ExtractionStore, and PDFs unchanged since the last
+    # span store are copied over without being opened.
+    os.makedirs(output_base, exist_ok=True)
+    path = os.path.join(output_base, SPAN_STORE_NAME)
+    pdf_paths = [
+        os.path.join(input_dir, filename)
+        for filename in sorted(os.listdir(input_dir))
+        if filename.lower().endswith(".pdf")
+    ]
+    previous = SpanLibrary.load(path) if os.path.exists(path) else None
+    store = None
+    if use_cache:
+        store = ExtractionStore(os.path.join(output_base, "extraction_cache.sqlite"))
+    try:
+        library = SpanLibrary.from_pdfs(pdf_paths, store, profile, previous)
+    finally:
+        if store is not None:
+            store.close()
+    library.save(path)
+    n_spans = len(library.columns["sizes"])
+    return f"📦 Saved {n_spans} spans from {len(library)} cookbooks to: {path}"
+
+
+def load_labels(path):
+    # {"Book.pdf": [12, 15, ...]}: the hand-checked first page of every
+    # recipe, 1-based as in a PDF viewer (and get_toc). Returned 0-based.
+    with open(path, encoding="utf-8") as f:
+        labels = json.load(f)
+    return {
+        source: sorted({page - 1 for page in pages}) for source, pages in labels.items()
+    }
+
+
+def boundary_counts(headings, true_pages):
+    # (hits, false starts, missed starts) of the detected recipe start pages
+    predicted = {page for _, page in headings}
+    hits = len(predicted.intersection(true_pages))
+    return hits, len(predicted) - hits, len(set(true_pages)) - hits
+
+
+def boundary_scores(hits, false_starts, missed):
+    precision = hits / (hits + false_starts) if hits + false_starts else 0.0
+    recall = hits / (hits + missed) if hits + missed else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def evaluate_heuristics(tables, labels, heuristics=None, vectorized=True):
+    # Boundary precision/recall of detect_headings against the labels,
+    # micro-averaged over every labelled book in `tables` ({source: SpanTable},
+    # e.g. from a SpanLibrary). "books" holds the per-book counts.
+    heuristics = heuristics or DEFAULT_HEURISTICS
+    books = {}
+    for source, true_pages in labels.items():
+        if source in tables:
+            headings = detect_headings(
+                tables[source], heuristics=heuristics, vectorized=vectorized
+            )
+            books[source] = boundary_counts(headings, true_pages)
+    totals = [sum(counts) for counts in zip(*books.values())] or [0, 0, 0]
+    return {**boundary_scores(*totals), "books": books}
+
+
+# Parameter grid of the "evaluate" command: {TitleHeuristics argument: values}
+DEFAULT_GRID = {
+    "max_length": [40, 50, 60],
+    "heading_size_ratio": [None, 1.1, 1.2, 1.4],
+    "max_heading_tiers": [None, 1, 2],
+}
+
+
+def heuristics_grid(grid, base=None):
+    # Every combination of the grid's values, as TitleHeuristics configs
+    # on top of `base`
+    base = (base or DEFAULT_HEURISTICS).config()
+    names = sorted(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield {**base, **dict(zip(names, values))}
+
+
+def _labelled_tables(store_path, labels):
+    library = SpanLibrary.load(store_path)
+    return {source: library.table(source) for source in labels if source in library}
+
+
+_eval_state = None
+
+
+def _init_eval_worker(store_path, labels):
+    # Each worker loads the span store once and keeps its tables (with their
+    # cached per-table arrays) for every config it is handed
+    global _eval_state
+    _eval_state = (_labelled_tables(store_path, labels), labels)
+
+
+def _evaluate_config(config):
+    tables, labels = _eval_state
+    return config, evaluate_heuristics(tables, labels, TitleHeuristics(**config))
+
+
+def evaluate_grid(store_path, labels, grid, jobs=1, base=None):
+    # Scores every config of the grid against the labels, in parallel over
+    # configs. Returns [(config, scores)], best F1 first (grid order on ties).
+    configs = list(heuristics_grid(grid, base))
+    if jobs > 1 and len(configs) > 1:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_eval_worker,
+            initargs=(store_path, labels),
+        ) as pool:
+            chunksize = max(1, len(configs) // (jobs * 4))
+            results = list(pool.map(_evaluate_config, configs, chunksize=chunksize))
+    else:
+        tables = _labelled_tables(store_path, labels)
+        results = [
+            (config, evaluate_heuristics(tables, labels, TitleHeuristics(**config)))
+            for config in configs
+        ]
+    return sorted(results, key=lambda result: -result[1]["f1"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cookbook")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build the cookbook site from PDFs")
+    build.add_argument("input_dir", nargs="?", default="pdfs")
+    build.add_argument("output_base", nargs="?", default="output")
+    build.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes"
+    )
+    build.add_argument(
+        "--no-cache", action="store_true", help="do not reuse extracted page text"
+    )
+    build.add_argument(
+        "--full", action="store_true", help="rebuild every PDF, ignoring the manifest"
+    )
+    build.add_argument(
+        "--profile",
+        choices=sorted(EXTRACTION_PROFILES),
+        default="text",
+        help="text extraction profile",
+    )
+    build.add_argument(
+        "--no-catalog", action="store_true", help=f"do not write {CATALOG_NAME}"
+    )
+    spans = commands.add_parser(
+        "spans", help="save the spans of every PDF to a columnar span store"
+    )
+    spans.add_argument("input_dir", nargs="?", default="pdfs")
+    spans.add_argument("output_base", nargs="?", default="output")
+    spans.add_argument(
+        "--no-cache", action="store_true", help="do not reuse extracted page text"
+    )
+    spans.add_argument(
+        "--profile",
+        choices=sorted(EXTRACTION_PROFILES),
+        default="text",
+        help="text extraction profile",
+    )
+    headings = commands.add_parser(
+        "headings", help="re-run heading detection on a span store (no PDFs needed)"
+    )
+    headings.add_argument("span_store", nargs="?", default=f"output/{SPAN_STORE_NAME}")
+    headings.add_argument("--vectorized", action="store_true")
+    evaluate = commands.add_parser(
+        "evaluate", help="score heuristic settings against labelled recipe pages"
+    )
+    evaluate.add_argument("labels", help="JSON: {pdf name: [1-based start pages]}")
+    evaluate.add_argument("--store", default=f"output/{SPAN_STORE_NAME}")
+    evaluate.add_argument(
+        "--grid", help="JSON: {TitleHeuristics argument: [values]} (default: built in)"
+    )
+    evaluate.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes"
+    )
+    evaluate.add_argument("--top", type=int, default=10)
+    evaluate.add_argument(
+        "--min-f1", type=float, help="fail if the default heuristics score lower"
+    )
+    find = commands.add_parser(
+        "find", help="recipes by ingredient, from the binary index of a build"
+    )
+    find.add_argument("include", nargs="*", help="words every recipe must have")
+    find.add_argument("--exclude", nargs="+", default=[], metavar="WORD")
+    find.add_argument("--any-of", nargs="+", default=[], metavar="WORD")
+    find.add_argument("--index", default=f"output/{INDEX_FILE_NAME}")
+    search = commands.add_parser(
+        "search", help="full-text search of the recipe catalog of a build"
+    )
+    search.add_argument("query", help='FTS5 query, e.g. "chicken lemon NOT nuts"')
+    search.add_argument("--catalog", default=f"output/{CATALOG_NAME}")
+    search.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print(
+            build_library(
+                args.input_dir,
+                args.output_base,
+                jobs=args.jobs,
+                cache_path=None if args.no_cache else "",
+                incremental=not args.full,
+                profile=args.profile,
+                catalog_path=None if args.no_catalog else "",
+            )
+        )
+    elif args.command == "spans":
+        print(
+            build_span_library(
+                args.input_dir, args.output_base, args.profile, not args.no_cache
+            )
+        )
+    elif args.command == "headings":
+        library = SpanLibrary.load(args.span_store)
+        total = 0
+        for source, table in library.tables():
+            found = detect_headings(table, vectorized=args.vectorized)
+            total += len(found)
+            print(f"{source}: {len(found)} recipes")
+        print(f"🔎 {total} recipes in {len(library)} cookbooks")
+    elif args.command == "evaluate":
+        labels = load_labels(args.labels)
+        grid = DEFAULT_GRID
+        if args.grid:
+            with open(args.grid, encoding="utf-8") as f:
+                grid = json.load(f)
+        default = DEFAULT_HEURISTICS.config()
+
+        def report(name, config, scores):
+            changed = {k: v for k, v in config.items() if v != default[k]}
+            print(
+                f"{name:>8}  F1 {scores['f1']:.3f}  P {scores['precision']:.3f}  "
+                f"R {scores['recall']:.3f}  {json.dumps(changed, ensure_ascii=False)}"
+            )
+
+        tables = _labelled_tables(args.store, labels)
+        missing = sorted(set(labels) - set(tables))
+        if missing:
+            print(f"⚠️ Not in the span store: {', '.join(missing)}")
+        baseline = evaluate_heuristics(tables, labels)
+        report("default", default, baseline)
+        results = evaluate_grid(args.store, labels, grid, args.jobs)
+        for rank, (config, scores) in enumerate(results[: args.top], 1):
+            report(f"#{rank}", config, scores)
+        if args.min_f1 is not None and baseline["f1"] < args.min_f1:
+            parser.exit(1, f"❌ Default heuristics F1 below {args.min_f1}\n")
+    elif args.command == "find":
+        if not os.path.exists(args.index):
+            parser.exit(1, f"❌ No binary ingredient index at {args.index}\n")
+        with MappedIndex(args.index) as index:
+            ids = index.find_recipes(args.include, args.exclude, args.any_of)
+            for rid in ids:
+                title, source = index.recipes[rid]
+                print(f"{title} — {source}")
+        print(f"🔎 {len(ids)} recipes")
+    elif args.command == "search":
+        if not os.path.exists(args.catalog):
+            parser.exit(1, f"❌ No recipe catalog at {args.catalog}\n")
+        with RecipeCatalog(args.catalog) as catalog:
+            try:
+                found = catalog.search(args.query, args.limit)
+            except sqlite3.OperationalError as e:
+                parser.exit(1, f"❌ Bad search query {args.query!r}: {e}\n")
+        for title, source, start, end in found:
+            print(f"{title} — {source}, pages {start + 1}-{max(end, start + 1)}")
+        print(f"🔎 {len(found)} recipes")
+
+
+if __name__ == "__main__":
+    main()
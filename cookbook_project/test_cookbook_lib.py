@@ -0,0 +1,456 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import unittest
+from array import array
+
+import fitz  # PyMuPDF
+
+from cookbook_lib import (
+    CATALOG_NAME,
+    MANIFEST_NAME,
+    SPAN_BOLD,
+    IngredientIndex,
+    MappedIndex,
+    Recipe,
+    Span,
+    SpanTable,
+    TitleHeuristics,
+    build_library,
+    detect_headings,
+    generate_toc,
+    load_pdf,
+    np,
+    parse_recipe_sections,
+    save_index,
+    score_titles,
+    sections_to_html,
+)
+
+
+def write_pdf(path, pages, toc=None):
+    # pages: [[(text, fontsize)]]; an empty list makes a blank page.
+    # toc: [(level, title, 1-based page)] bookmarks
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        y = 72
+        for text, size in lines:
+            page.insert_text((72, y), text, fontsize=size)
+            y += size * 1.5
+    if toc:
+        doc.set_toc([list(entry) for entry in toc])
+    doc.save(path)
+    doc.close()
+
+
+def recipe_page(title, *ingredients):
+    lines = [(title, 24), ("Ingredients", 14)]
+    lines += [(f"200 grams {ingredient}", 10) for ingredient in ingredients]
+    return lines + [("Method", 14), ("Stir well and serve hot.", 10)]
+
+
+RECIPES = [f"{name} {dish}" for dish in ("Soup", "Salad", "Tart") for name in (
+    "Lemon", "Tomato", "Pea", "Leek", "Onion",
+)]  # fmt: skip
+
+
+# Span texts that exercise every title rule
+TITLE_TEXTS = [
+    "Lemon Chicken", "lemon chicken", "Pad Thai", "Ingredients", "METHOD",
+    "Directions", "The Cookery", "The Cookery Book", "200 grams rice",
+    "1 cup milk", "Cupcakes", "Oz Pie", "Tablespoon Tart", "Serves 4",
+    "Stir well.", "", "   ", "  Leek Soup  ", "x" * 49, "x" * 50,
+    "Tom Yum \u0663", "Dhal \u00b2", "Cr\u00e8me br\u00fbl\u00e9e",
+]  # fmt: skip
+
+
+def random_pages(rng, n_pages=40):
+    # Pages of Spans with a dominant body size, a few heading sizes and ties
+    sizes = [10.0] * 6 + [9.5, 10.04, 12.0, 14.0, 14.0, 18.0, 24.0]
+    pages = []
+    for _ in range(n_pages):
+        pages.append(
+            [
+                Span(
+                    rng.choice(TITLE_TEXTS),
+                    rng.choice(sizes),
+                    rng.choice(["Regular", "Bold"]),
+                    rng.choice([0, SPAN_BOLD]),
+                    (0.0, 0.0, 10.0, 10.0),
+                )
+                for _ in range(rng.randint(0, 12))
+            ]
+        )
+    return pages
+
+
+def legacy_title(spans):
+    # The sort-based picker TitleHeuristics replaced
+    title_candidates = []
+    for span in spans:
+        text = span.text.strip()
+        size = span.size
+        if (
+            text
+            and len(text) < 50
+            and not any(char.isdigit() for char in text)
+            and not re.search(
+                r"\b(grams|ml|cup|tablespoon|teaspoon|oz)\b", text.lower()
+            )
+            and not re.match(
+                r"(?i)^(ingredients|method|directions|the cookery)$",
+                text.lower(),
+            )
+            and not text.endswith(".")
+        ):
+            title_candidates.append((text, size))
+    return (
+        sorted(title_candidates, key=lambda x: -x[1])[0][0]
+        if title_candidates
+        else None
+    )
+
+
+def legacy_sections_html(text):
+    # The two chained re.sub calls parse_recipe_sections replaced
+    parsed = re.sub(
+        r"(?i)\bingredients\b", "\n\n<h2>Ingredients</h2>", text, count=1
+    )
+    parsed = re.sub(
+        r"(?i)\bmethod\b|\bdirections\b", "\n\n<h2>Method</h2>", parsed, count=1
+    )
+    return parsed.strip().replace("\n", "<br>")
+
+
+class TitleRulesTest(unittest.TestCase):
+    def test_pick_matches_legacy_picker(self):
+        rng = random.Random(8)
+        heuristics = TitleHeuristics(heading_size_ratio=None)
+        for spans in random_pages(rng, 2000):
+            self.assertEqual(heuristics.pick(spans), legacy_title(spans), spans)
+
+    @unittest.skipIf(np is None, "requires numpy")
+    def test_score_titles_matches_pick(self):
+        rng = random.Random(12)
+        for heuristics in (
+            TitleHeuristics(),
+            TitleHeuristics(max_heading_tiers=1),
+            TitleHeuristics(heading_size_ratio=None),
+        ):
+            for _ in range(50):
+                pages = random_pages(rng)
+                tiers = heuristics.font_tiers(pages)
+                expected = []
+                for pno, spans in enumerate(pages):
+                    title = heuristics.pick(spans, tiers)
+                    if title:
+                        expected.append((title, pno))
+                table = SpanTable.from_pages(pages)
+                self.assertEqual(score_titles(table, heuristics), expected)
+
+
+class RecipeSectionsTest(unittest.TestCase):
+    def test_matches_chained_substitutions(self):
+        rng = random.Random(15)
+        tokens = [
+            "ingredients", "Ingredients", "INGREDIENTS", "method", "Method",
+            "directions", "DIRECTIONS", "methods", "xingredients", "method_",
+            "salt", "2", "\u00e9", "-", " ", " ", "\n", "\n",
+        ]  # fmt: skip
+        for _ in range(5000):
+            text = "".join(rng.choice(tokens) for _ in range(rng.randint(0, 16)))
+            self.assertEqual(
+                sections_to_html(parse_recipe_sections(text)),
+                legacy_sections_html(text),
+                repr(text),
+            )
+
+    def test_sections_in_text_order(self):
+        text = "Serves 2\nMethod\nStir.\nIngredients\nrice\nmethod again"
+        self.assertEqual(
+            parse_recipe_sections(text),
+            [
+                (None, "Serves 2\n"),
+                ("method", "\nStir.\n"),
+                ("ingredients", "\nrice\nmethod again"),
+            ],
+        )
+
+
+INDEX_WORDS = [
+    "chicken", "lemon", "garlic", "rice", "basil", "nuts", "lime", "pork",
+]  # fmt: skip
+
+
+def random_recipes(rng, sources, per_source=30):
+    # Recipes whose texts mix index words with stop words and short words
+    filler = ["cup", "the", "of", "a", "GRAMS", "2"]
+    recipes = []
+    for source in sources:
+        for i in range(rng.randint(0, per_source)):
+            words = rng.sample(INDEX_WORDS, rng.randint(0, 4))
+            words += rng.sample(filler, 2)
+            text = " ".join(
+                word.upper() if rng.random() < 0.2 else word for word in words
+            )
+            recipes.append(Recipe(None, f"Dish {i}", None, source, 0, 1, text, None))
+    return recipes
+
+
+class IngredientIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(23)
+
+    def test_merge_is_associative(self):
+        for _ in range(50):
+            a, b, c = (
+                IngredientIndex.from_recipes(random_recipes(self.rng, [source]))
+                for source in ("A.pdf", "B.pdf", "C.pdf")
+            )
+            before = [index.to_record() for index in (a, b, c)]
+            merged = a.merge(b, c).to_record()
+            self.assertEqual(a.merge(b).merge(c).to_record(), merged)
+            self.assertEqual(a.merge(b.merge(c)).to_record(), merged)
+            self.assertEqual(IngredientIndex().merge(a, b, c).to_record(), merged)
+            # Merging leaves the shards as they were
+            self.assertEqual([index.to_record() for index in (a, b, c)], before)
+
+    def test_merge_matches_one_index(self):
+        for _ in range(50):
+            recipes = random_recipes(self.rng, ["A.pdf", "B.pdf", "C.pdf"])
+            shards = [
+                IngredientIndex.from_recipes(
+                    [recipe for recipe in recipes if recipe.source == source]
+                )
+                for source in ("A.pdf", "B.pdf", "C.pdf")
+            ]
+            self.assertEqual(
+                IngredientIndex().merge(*shards).to_record(),
+                IngredientIndex.from_recipes(recipes).to_record(),
+            )
+
+    def test_remove_source(self):
+        for _ in range(50):
+            recipes = random_recipes(self.rng, ["A.pdf", "B.pdf", "C.pdf"])
+            index = IngredientIndex.from_recipes(recipes)
+            kept = [recipe for recipe in recipes if recipe.source != "B.pdf"]
+            self.assertEqual(
+                index.remove_source("B.pdf").to_record(),
+                IngredientIndex.from_recipes(kept).to_record(),
+            )
+
+    def test_find_recipes_matches_sets(self):
+        recipes = random_recipes(self.rng, ["A.pdf", "B.pdf"], per_source=200)
+        index = IngredientIndex.from_recipes(recipes)
+        words = {
+            rid: {word for word in INDEX_WORDS if word in recipe.text.lower()}
+            for rid, recipe in enumerate(recipes)
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "Index.bin")
+            save_index(index, path, format="binary")
+            with MappedIndex(path) as mapped:
+                for _ in range(500):
+                    vocabulary = INDEX_WORDS + ["saffron", "Lemon"]
+                    include, exclude, any_of = (
+                        self.rng.sample(vocabulary, self.rng.randint(0, 3))
+                        for _ in range(3)
+                    )
+                    expected = [
+                        rid
+                        for rid, found in words.items()
+                        if all(word.lower() in found for word in include)
+                        and not any(word.lower() in found for word in exclude)
+                        and (
+                            not any_of
+                            or any(word.lower() in found for word in any_of)
+                        )
+                    ]
+                    for queried in (index, mapped):
+                        ids = queried.find_recipes(include, exclude, any_of)
+                        self.assertEqual(list(ids), expected)
+
+
+class MappedIndexTest(unittest.TestCase):
+    def test_binary_round_trip(self):
+        rng = random.Random(25)
+        top = 2**32 - 1
+        # Short lists decode in Python, long ones (over 64 bytes) with numpy
+        postings = {
+            "basil": [0],
+            "chicken": sorted(rng.sample(range(2000), 300)),
+            "cr\u00e8me": [5, 2**28, 2**28 + 1, top],
+            "lemon": sorted(rng.sample(range(2**28, top), 200)) + [top],
+            "lime": sorted(rng.sample(range(top), 5)),
+            "\u00e9pice": [127, 128, 16383, 16384],
+        }
+        recipes = [(f"Dish {i}", f"{'AB'[i % 2]}.pdf") for i in range(10)]
+        recipes[3] = ("Cr\u00e8me br\u00fbl\u00e9e", "C\u00f4te.pdf")
+        index = IngredientIndex(
+            recipes, {word: array("I", ids) for word, ids in postings.items()}
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "Index.bin")
+            save_index(index, path, format="binary")
+            with MappedIndex(path) as mapped:
+                self.assertEqual(list(mapped), sorted(postings))
+                self.assertEqual(list(mapped.recipes), recipes)
+                for word, ids in postings.items():
+                    self.assertIn(word, mapped)
+                    self.assertEqual(mapped.count(word), len(ids))
+                    self.assertEqual(list(mapped.postings(word)), ids)
+                for word in ("", "apple", "zucchini", "lemons"):
+                    self.assertNotIn(word, mapped)
+                    self.assertEqual(len(mapped.postings(word)), 0)
+                self.assertEqual(mapped["basil"], ["Dish 0"])
+
+    def test_rejects_other_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "Index.bin")
+            with open(path, "wb") as f:
+                f.write(bytes(256))
+            with self.assertRaises(ValueError):
+                MappedIndex(path)
+
+
+class OutlineHeadingsTest(unittest.TestCase):
+    def headings(self, toc):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "book.pdf")
+            write_pdf(path, [recipe_page(title, "lemon") for title in RECIPES], toc)
+            doc = load_pdf(path)
+            try:
+                return detect_headings(doc)
+            finally:
+                doc.close()
+
+    def test_chapter_bookmarks_fall_back_to_fonts(self):
+        toc = [(1, "Soups", 1), (1, "Salads", 6), (1, "Tarts", 11)]
+        self.assertEqual(self.headings(toc), [(t, p) for p, t in enumerate(RECIPES)])
+
+    def test_recipe_bookmarks_are_used(self):
+        toc = [(1, f"Recipe {page}", page) for page in range(1, len(RECIPES) + 1)]
+        expected = [(f"Recipe {page + 1}", page) for page in range(len(RECIPES))]
+        self.assertEqual(self.headings(toc), expected)
+
+
+class GenerateTocTest(unittest.TestCase):
+    def toc(self, headings):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "TOC.md")
+            generate_toc(headings, path)
+            with open(path, encoding="utf-8") as f:
+                return f.read().splitlines()[2:]
+
+    def test_page_headings_that_sanitize_alike(self):
+        self.assertEqual(
+            self.toc([("Pie!", 0), ("Pie?", 3), ("Lemon Chicken", 5)]),
+            [
+                "1. [Pie!](cookbook_site/recipes/Pie.html)",
+                "2. [Pie?](cookbook_site/recipes/Pie_2.html)",
+                "3. [Lemon Chicken](cookbook_site/recipes/Lemon_Chicken.html)",
+            ],
+        )
+
+
+class BuildLibraryTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+        self.pdfs = os.path.join(self.tmp, "pdfs")
+        self.output = os.path.join(self.tmp, "output")
+        os.makedirs(self.pdfs)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def build(self, **kwargs):
+        kwargs.setdefault("jobs", 1)
+        return build_library(self.pdfs, self.output, log=lambda _: None, **kwargs)
+
+    def manifest(self):
+        with open(os.path.join(self.output, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_pdf_without_text(self):
+        # A scanned, image-only book has no headings and must not stop the build
+        write_pdf(
+            os.path.join(self.pdfs, "A.pdf"), [recipe_page("Lemon Chicken", "lemon")]
+        )
+        write_pdf(os.path.join(self.pdfs, "Scanned.pdf"), [[], []])
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                self.build(jobs=jobs, incremental=False)
+                pdfs = self.manifest()["pdfs"]
+                self.assertEqual(pdfs["Scanned.pdf"]["headings"], [])
+                self.assertEqual(pdfs["A.pdf"]["headings"], [["Lemon Chicken", 0]])
+                self.assertIn("(2 unchanged)", self.build(jobs=jobs))
+
+    def test_split_pdfs_are_reproducible(self):
+        def split_pdfs():
+            split_dir = os.path.join(self.output, "Split_A")
+            files = {}
+            for name in sorted(os.listdir(split_dir)):
+                path = os.path.join(split_dir, name)
+                with open(path, "rb") as f:
+                    files[name] = (f.read(), os.stat(path).st_mtime_ns)
+            return files
+
+        write_pdf(
+            os.path.join(self.pdfs, "A.pdf"),
+            [recipe_page(title, "lemon") for title in RECIPES[:3]],
+        )
+        write_pdf(os.path.join(self.pdfs, "B.pdf"), [recipe_page("Pie", "apple")])
+        self.build()
+        first = split_pdfs()
+        self.assertEqual(len(first), 3)
+        # The same pages give the same bytes, so a rebuild leaves them alone
+        self.build(jobs=2, incremental=False)
+        self.assertEqual(split_pdfs(), first)
+
+    def test_slugs_do_not_move_when_books_are_added(self):
+        def pages():
+            outputs = self.manifest()["master"]["outputs"]["master_site"]
+            return {path for path in outputs if "Chicken" in path}
+
+        def catalog_slugs():
+            conn = sqlite3.connect(os.path.join(self.output, CATALOG_NAME))
+            try:
+                return sorted(conn.execute("SELECT title, source, slug FROM recipes"))
+            finally:
+                conn.close()
+
+        write_pdf(
+            os.path.join(self.pdfs, "B.pdf"), [recipe_page("Lemon Chicken", "lemon")]
+        )
+        self.build()
+        self.assertEqual(pages(), {"cookbook_site/recipes/Lemon_Chicken.html"})
+        # A sorts before B and has the same recipe
+        write_pdf(
+            os.path.join(self.pdfs, "A.pdf"), [recipe_page("Lemon Chicken", "lime")]
+        )
+        for incremental in (True, False):
+            with self.subTest(incremental=incremental):
+                self.build(incremental=incremental)
+                self.assertEqual(
+                    pages(),
+                    {
+                        "cookbook_site/recipes/Lemon_Chicken.html",
+                        "cookbook_site/recipes/Lemon_Chicken__A.html",
+                    },
+                )
+                slugs = [
+                    ["Lemon Chicken", "B.pdf", "Lemon_Chicken"],
+                    ["Lemon Chicken", "A.pdf", "Lemon_Chicken__A"],
+                ]
+                self.assertEqual(self.manifest()["master"]["slugs"], slugs)
+                # The catalog links to the same master-site pages
+                self.assertEqual(catalog_slugs(), sorted(map(tuple, slugs)))
+
+
+if __name__ == "__main__":
+    unittest.main()